@@ -1,24 +1,30 @@
 from __future__ import annotations
 from _collections import deque
+import heapq
 import os
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
 import numpy as np
 import math
-from dataclasses import dataclass
+import time
 from copy import deepcopy
 
 
 from utilities import Utilities as utils
-from utilities import Pos
+from utilities import BoxCombinatorics
+from heuristics import MatchingHeuristic
+from heuristics import PatternDatabaseHeuristic
+from deadlocks import DeadlockDetector
+from transposition import ZobristHasher
+from transposition import TranspositionTable
+from parallel import ParallelSearch
+from batched import BatchedBFS
+from arena import NodeArena
+from board import Board
+from level_pack import LevelPack
+from stats import SearchStats
 from defines import *
-from simulation import Simulation
-from simulation import Display
-import pygame
-from pygame.locals import *
 from enum import Enum
 
-from MapGenerator import MapGenerator
-
 # position = (row, col)
 # index = 1D position
 
@@ -35,24 +41,14 @@ class Algorithms(Enum):
     BFS = "BFS"
     DFS = "DFS"
     AStar = "A*"
-
-
-@dataclass
-class Node:
-    parent_node: Node
-    state: float
-    depth: int
-    cost: float
-    # boxes_state + agent_state / 100
-
-    def __lt__(self, other):
-        return self.cost < other.cost
-
-    def __gt__(self, other):
-        return self.cost > other.cost
+    IDAStar = "IDA*"
+    Bidirectional = "Bidirectional"
+    ParallelAStar = "Parallel A*"
 
 
 def wait():
+    import pygame
+    from pygame.locals import QUIT, KEYDOWN, K_SPACE
     while True:
         for event in pygame.event.get():
             if event.type == QUIT:
@@ -62,311 +58,608 @@ def wait():
                 return
 
 class Search:
-    def __init__(self, map_file_path):
+    def __init__(self, map_file_path=None, transposition_budget=TRANSPOSITION_BUDGET, ida_cache_budget=IDA_CACHE_BUDGET,
+                 num_workers=None, heuristic_weight=1, visualize=True, verbose=True, map_text=None, stats=None,
+                 pattern_database_directory=None):
+        self.stats = stats or SearchStats()
+        setup_start = time.perf_counter()
+        # The map is read from map_text when it is given, otherwise from map_file_path
         self.map_file_path = map_file_path
+        self.map_text = map_text
+        self.transposition_budget = transposition_budget
+        self.ida_cache_budget = ida_cache_budget
+        self.num_workers = num_workers
+        # Weights above 1 make A* and IDA* greedier, trading solution length for speed
+        self.heuristic_weight = heuristic_weight
+        # pygame is only imported when visualizing
+        self.visualize = visualize
+        self.verbose = verbose
         self.rows = 0
         self.cols = 0
         self.environment = []
 
-        self.moves = [Pos(-1, 0), Pos(0, -1), Pos(1, 0), Pos(0, 1)]
-
         self.num_boxes, self.num_spaces = self.read_map()
         self.initial_environment = self.environment
 
-        self.corners = self.detect_corners()
-
+        # Positions are only needed to draw, the search itself works on space indices
         self.pos2index, self.index2pos = utils.create_space_and_index_conversion_dictionaries(self.rows, self.cols, self.environment)
-        self.boxes_positions2state, self.boxes_state2positions = utils.create_boxes_combinatorics_conversion_dictionaries(self.num_spaces,self.num_boxes,self.index2pos,self.corners)
-        self.move2dir, self.dir2move = utils.create_move_and_dir_dictionaries()
+        self.index2cell = self.board.cells.tolist()
+        self.boxes_combinatorics = BoxCombinatorics(self.num_spaces, self.num_boxes)
+        self.neighbours = self.create_neighbour_table()
 
         self.boxes_state = self.get_state_of_boxes()
         self.agent_state = self.get_state_of_agent()
 
         self.to_be_visited = deque()
-        self.to_be_visited_lookup = {}
-        self.visited_nodes = {}
+        self.zobrist = ZobristHasher(self.num_spaces)
+        self.transposition_table = TranspositionTable(self.transposition_budget)
+        self.push_level = False
+        # Packed states fit the arena's typed buffers unless the map is huge
+        self.typed_states = self.boxes_combinatorics.num_states * self.num_spaces < 2 ** 63
+        self.arena = NodeArena(self.typed_states)
 
-        assert self.num_spaces < 100
         assert self.agent_state > 0
         assert len(self.pos2index.keys()) == self.num_spaces
-        #assert len(self.boxes_positions2state.keys()) == math.comb(self.num_spaces,self.num_boxes)
 
         self.goal_state = self.get_goal_state()
-        self.goal_positions = self.boxes_state2positions[self.goal_state]
-
-        self.display = Display((self.cols, self.rows))
-        self.display.update(self.environment, self.index2pos[self.agent_state])
+        # push_distances[g, index] is the number of pushes from index onto goal g
+        self.push_distances = self.board.push_distance_tables(self.boxes_combinatorics.unrank(self.goal_state))
+        self.dead_squares = self.detect_dead_squares()
+        self.deadlock_detector = DeadlockDetector(self.board, self.neighbours, self.dead_squares,
+                                                  self.boxes_combinatorics.unrank(self.goal_state))
+        self.heuristic = MatchingHeuristic(self.boxes_combinatorics, self.boxes_combinatorics.unrank(self.goal_state),
+                                           self.push_distances.tolist())
+        # Pattern databases built offline for this map replace the matching bound with a stronger one
+        if pattern_database_directory is not None:
+            tables = PatternDatabaseHeuristic.load_tables(pattern_database_directory, self.map_text, self.num_boxes)
+            if tables:
+                self.heuristic = PatternDatabaseHeuristic(self.heuristic, tables)
+        self.stats.phase_times["setup"] = time.perf_counter() - setup_start
+
+        if self.visualize:
+            from simulation import Display
+            self.display = Display((self.cols, self.rows))
+            self.display.update(self.environment, self.index2pos[self.agent_state])
+
+    @property
+    def num_expanded(self):
+        return self.stats.num_expanded
 
     def read_map(self):
-        map_file = open(self.map_file_path, 'r')
-        lines = map_file.readlines()
-        map_rows = [line.replace('\n', '') for line in lines]
-        self.rows = len(map_rows)
-        self.cols = len(map_rows[0])
-        self.environment = np.chararray((self.rows, self.cols), unicode=True)
-        for y, row in enumerate(map_rows):
-            for x, el in enumerate(row):
-                self.environment[y][x] = el
-
-        num_boxes = num_spaces = 0
-        for y, row in enumerate(map_rows):
-            for x, el in enumerate(row):
-                if self.environment[y][x] == BOX:
-                    num_boxes += 1
-                if self.environment[y][x] != WALL:
-                    num_spaces += 1
-        return num_boxes, num_spaces
-
-    def detect_corners(self):
-        corners = []
-        for y in range(self.rows):
-            for x in range(self.cols):
-                if self.environment[y][x] != WALL and self.environment[y][x] != GOAL:
-                    num_surrounding_walls = 0
-                    env_pos = Pos(x,y)
-                    for move in self.moves:
-                        surrounding_space = env_pos + move
-                        if self.environment[surrounding_space.y][surrounding_space.x] == WALL:
-                            num_surrounding_walls += 1
-                    if num_surrounding_walls >= 2:
-                        corners.append(env_pos)
-        return corners
-
-    def print_environment(self,node: Node):
-        for row in range(self.rows):
-            for col in range(self.cols):
-                el = Pos(col,row)
-                if self.pos2index.get(el) is None:
-                    self.environment[row][col] = WALL
-                else:
-                    self.environment[row][col] = PASSAGE
+        # map_file_path may also name a level of a pack as "path#n"
+        if self.map_text is None:
+            self.map_text = LevelPack.read_level(self.map_file_path)
+        self.board = Board(self.map_text)
+        self.rows = self.board.rows
+        self.cols = self.board.cols
+        self.environment = self.board.environment()
+        return self.board.num_boxes, self.board.num_spaces
+
+    def encode_state(self, boxes_state, agent_state):
+        return boxes_state * self.num_spaces + agent_state - 1
+
+    def decode_state(self, state):
+        boxes_state, agent_offset = divmod(state, self.num_spaces)
+        return boxes_state, agent_offset + 1
 
-        agent_state = round((node.state % 1) * 100)
-        agent_pos = self.index2pos[agent_state]
+    def detect_dead_squares(self):
+        # A space is dead if a box pulled backwards from the goals never reaches it
+        return np.isinf(self.push_distances).all(axis=0).tolist()
 
-        boxes_state = math.floor(node.state)
-        boxes_positions = self.boxes_state2positions[boxes_state]
+    def print_environment(self, state):
+        self.environment = np.where(self.board.walls, WALL, PASSAGE).view(np.chararray)
 
-        self.environment[agent_pos.y][agent_pos.x] = AGENT
+        boxes_state, agent_state = self.decode_state(state)
+        coordinates = self.board.coordinates
+        boxes_coordinates = coordinates[self.boxes_combinatorics.unrank(boxes_state)]
 
-        for box_pos in boxes_positions:
-            self.environment[box_pos.y][box_pos.x] = BOX
+        self.environment[boxes_coordinates[:, 0], boxes_coordinates[:, 1]] = BOX
+        self.environment[tuple(coordinates[agent_state])] = AGENT
 
         print(self.environment)
 
     def get_state_of_boxes(self):
-        box_positions = ()
-        for row in range(self.rows):
-            for col in range(self.cols):
-                if self.environment[row][col] == BOX:
-                    key = Pos(col, row),
-                    box_positions += key
-        box_positions = tuple(sorted(box_positions))
-        return self.boxes_positions2state[box_positions]
+        return self.boxes_combinatorics.indices2state(self.board.indices(self.board.boxes))
 
     def get_state_of_agent(self):
-        agent_index = 0
-        for row in range(self.rows):
-            for col in range(self.cols):
-                if self.environment[row][col] == AGENT:
-                    key = Pos(col, row)
-                    agent_index = self.pos2index[key]
-        return agent_index
+        return self.board.indices(self.board.agent)[0]
 
     def get_goal_state(self):
-        goal_positions = ()
-        for row in range(self.rows):
-            for col in range(self.cols):
-                if self.environment[row][col] == GOAL:
-                    key = Pos(col, row),
-                    goal_positions += key
-        goal_positions = tuple(sorted(goal_positions))
-        return self.boxes_positions2state[goal_positions]
-
-    def calculate_cost(self, box_positions, agent_pos, depth):
-        cost = 0
+        return self.boxes_combinatorics.indices2state(self.board.indices(self.board.goals))
+
+    def calculate_cost(self, boxes_state, depth):
+        # f = g + h, with h a lower bound on the pushes left
+        start = time.perf_counter()
+        cost = depth + self.heuristic_weight * self.heuristic.estimate(boxes_state)
+        self.stats.phase_times["heuristic"] += time.perf_counter() - start
+        if cost == math.inf:
+            self.stats.prunes["unreachable"] += 1
+        return cost
 
-        box_cost = 0
-        for box in box_positions:
-            box_goal_distance = 0
-            for goal in self.goal_positions:
-                distance = abs(box.x - goal.x) + abs(box.y - goal.y)
-                if not distance:
-                    box_goal_distance = 0
-                    break
-                box_goal_distance += 10 * distance
+    def generate_children(self, state, depth, key, with_cost=False):
+        # Children are (state, key, cost) tuples at depth + 1
+        boxes_state, agent_state = self.decode_state(state)
+        boxes_indices = self.boxes_combinatorics.unrank(boxes_state)
+        boxes = set(boxes_indices)
 
-            box_goal_distance /= len(self.goal_positions)
-            box_cost += box_goal_distance
+        children = []
 
-        box_cost /= len(box_positions)
+        for i, new_agent_state in enumerate(self.neighbours[agent_state]):
+            if new_agent_state is None:
+                continue
 
-        agent_box_distance = 0
-        for box in box_positions:
-            agent_box_distance += abs(agent_pos.x - box.x) + abs(agent_pos.y - box.y)
+            new_box_index = None
+            new_boxes_state = boxes_state
+            if new_agent_state in boxes:
+                new_box_index = self.neighbours[new_agent_state][i]
+                # Boxes can not be pushed into walls or into each other
+                if new_box_index is None or new_box_index in boxes:
+                    continue
+                # A box pushed onto a dead square can never reach a goal
+                if self.dead_squares[new_box_index]:
+                    self.stats.prunes["dead_square"] += 1
+                    continue
+
+                new_boxes_indices = [new_box_index if index == new_agent_state else index for index in boxes_indices]
+                new_boxes_state = self.boxes_combinatorics.indices2state(new_boxes_indices)
+                # Only a push can create a freeze or block deadlock, and only around the pushed box
+                deadlock_type = self.deadlock_detector.deadlock_type(new_box_index, set(new_boxes_indices))
+                if deadlock_type is not None:
+                    self.stats.prunes[deadlock_type] += 1
+                    continue
+
+            new_state = self.encode_state(new_boxes_state, new_agent_state)
+            new_key = self.zobrist.move_agent(key, agent_state, new_agent_state)
+            if new_box_index is not None:
+                new_key = self.zobrist.move_box(new_key, new_agent_state, new_box_index)
+            cost = 0
+            if with_cost:
+                cost = self.calculate_cost(new_boxes_state, depth + 1)
+                # No box layout reachable from here fills every goal
+                if cost == math.inf:
+                    continue
+            children.append((new_state, new_key, cost))
 
-        agent_box_distance /= len(box_positions)
+        return children
 
-        agent_cost = 2 * depth / self.num_spaces # agent_box_distance / (depth + 1) + depth / agent_box_distance
+    def create_neighbour_table(self):
+        # neighbours[index][i] is the space reached from index by action i, None if it is a wall
+        neighbours = [tuple(index or None for index in row) for row in self.board.neighbours.tolist()]
+        neighbours[0] = None
+        return neighbours
+
+    def reachable_indices(self, agent_index, boxes_indices):
+        # Flood fill over the free spaces the agent can reach without pushing a box
+        reachable = {agent_index}
+        frontier = [agent_index]
+        while frontier:
+            index = frontier.pop()
+            for next_index in self.neighbours[index]:
+                if next_index is None or next_index in reachable or next_index in boxes_indices:
+                    continue
+                reachable.add(next_index)
+                frontier.append(next_index)
+        return reachable
+
+    def normalize_agent(self, agent_index, boxes_indices):
+        # The canonical agent position is the top-left space of its reachable region
+        return min(self.reachable_indices(agent_index, boxes_indices))
+
+    def generate_pushes(self, state, depth, key, with_cost=False):
+        boxes_state, agent_state = self.decode_state(state)
+        boxes_indices = self.boxes_combinatorics.unrank(boxes_state)
+        boxes = set(boxes_indices)
+        reachable = self.reachable_indices(agent_state, boxes)
 
-        cost = box_cost + agent_cost
+        children = []
 
-        return cost
+        for box_index in boxes_indices:
+            neighbours = self.neighbours[box_index]
+            for i, new_box_index in enumerate(neighbours):
+                # The agent stands on the opposite side of the box and pushes it into a free space
+                if new_box_index is None or new_box_index in boxes or neighbours[(i + 2) % 4] not in reachable:
+                    continue
+                if self.dead_squares[new_box_index]:
+                    self.stats.prunes["dead_square"] += 1
+                    continue
+
+                new_boxes_indices = [new_box_index if index == box_index else index for index in boxes_indices]
+                new_boxes_state = self.boxes_combinatorics.indices2state(new_boxes_indices)
+                if new_boxes_state is None:
+                    continue
+                new_boxes = set(new_boxes_indices)
+                deadlock_type = self.deadlock_detector.deadlock_type(new_box_index, new_boxes)
+                if deadlock_type is not None:
+                    self.stats.prunes[deadlock_type] += 1
+                    continue
+
+                new_agent_state = self.normalize_agent(box_index, new_boxes)
+                new_state = self.encode_state(new_boxes_state, new_agent_state)
+                new_key = self.zobrist.move_agent(key, agent_state, new_agent_state)
+                new_key = self.zobrist.move_box(new_key, box_index, new_box_index)
+                cost = 0
+                if with_cost:
+                    cost = self.calculate_cost(new_boxes_state, depth + 1)
+                    if cost == math.inf:
+                        continue
+                children.append((new_state, new_key, cost))
 
-    def generate_children(self, node: Node, with_cost=False):
-        agent_state = round((node.state % 1) * 100)
-        agent_pos = self.index2pos[agent_state]
+        return children
 
-        boxes_state = math.floor(node.state)
-        boxes_positions = self.boxes_state2positions[boxes_state]
+    def generate_pulls(self, state, depth, key):
+        # Reverse of generate_pushes: the agent steps away from a box and drags it along
+        boxes_state, agent_state = self.decode_state(state)
+        boxes_indices = self.boxes_combinatorics.unrank(boxes_state)
+        boxes = set(boxes_indices)
+        reachable = self.reachable_indices(agent_state, boxes)
 
         children = []
 
-        for move in self.moves:
-            next_agent_pos = agent_pos + move
-            new_agent_state = self.pos2index.get(next_agent_pos)
-            if new_agent_state is None:
-                continue
-
-            new_boxes_positions = ()
-            for box_pos in boxes_positions:
-                if next_agent_pos == box_pos:
-                    new_box_pos = box_pos + move
-                    new_boxes_positions += new_box_pos,
-                else:
-                    new_boxes_positions += box_pos,
-
-            new_boxes_positions = tuple(sorted(new_boxes_positions))
-            new_boxes_state = self.boxes_positions2state.get(new_boxes_positions)
-            # If new_boxes_state is None it means that the boxes positions are not possible
-            # if new_boxes_state is negative it indicates a deadlock
-            if new_boxes_state is None or new_boxes_state < 0:
-                continue
-
-            new_state = new_boxes_state + new_agent_state / 100
-            cost = 0
-            if with_cost:
-                cost = self.calculate_cost(boxes_positions, next_agent_pos, node.depth)
-            children.append(Node(node, new_state, node.depth + 1, cost))
+        for box_index in boxes_indices:
+            for i, new_box_index in enumerate(self.neighbours[box_index]):
+                # The agent stands on new_box_index and steps further away in the same direction
+                if new_box_index is None or new_box_index not in reachable:
+                    continue
+                new_agent_index = self.neighbours[new_box_index][i]
+                if new_agent_index is None or new_agent_index in boxes:
+                    continue
+
+                new_boxes_indices = [new_box_index if index == box_index else index for index in boxes_indices]
+                new_boxes_state = self.boxes_combinatorics.indices2state(new_boxes_indices)
+                new_agent_state = self.normalize_agent(new_agent_index, set(new_boxes_indices))
+                new_state = self.encode_state(new_boxes_state, new_agent_state)
+                new_key = self.zobrist.move_agent(key, agent_state, new_agent_state)
+                new_key = self.zobrist.move_box(new_key, box_index, new_box_index)
+                children.append((new_state, new_key, 0))
 
         return children
 
-            # TODO Don't care about checking game physics. All possible combinations and positions have been generated.
-            #  Look up in dictionary. If dictionary returns default value then the position is illegal. (out of bounds)
-            #  Move boxes if agent index == box index. If new box combinations does not exist in dictionary. It is
-            #  invalid.
+    def generate_pull_roots(self):
+        # The last push leaves the agent next to a box on a goal, in any of the regions around the goals
+        goal_indices = self.boxes_combinatorics.unrank(self.goal_state)
+        boxes = set(goal_indices)
+        roots = {}
+        for goal_index in goal_indices:
+            for index in self.neighbours[goal_index]:
+                if index is None or index in boxes:
+                    continue
+                agent_state = self.normalize_agent(index, boxes)
+                state = self.encode_state(self.goal_state, agent_state)
+                if state not in roots:
+                    roots[state] = self.zobrist.hash(goal_indices, agent_state)
+        return list(roots.items())
+
+    def expand_layer(self, layer, arena, visited, other_visited, generate):
+        # Expands one BFS layer of one side, returns the next layer and the meeting nodes (own side first)
+        next_layer = []
+        for index in layer:
+            depth = arena.g[index]
+            self.stats.expanded(len(layer) + len(next_layer), depth)
+            start = time.perf_counter()
+            children = generate(arena.states[index], depth, arena.keys[index])
+            self.stats.phase_times["expansion"] += time.perf_counter() - start
+            self.stats.num_generated += len(children)
+            for state, key, _ in children:
+                if state in visited:
+                    self.stats.num_duplicates += 1
+                    continue
+                child = arena.add(index, state, key, depth + 1)
+                visited[state] = child
+                if state in other_visited:
+                    return next_layer, (child, other_visited[state])
+                next_layer.append(child)
+        return next_layer, None
+
+    def bidirectional_search(self, root_state, root_key):
+        # Forward push search from the start and backward pull search from the goal layout,
+        # always expanding the side with the smaller frontier until the two meet
+        forward = NodeArena(self.typed_states)
+        backward = NodeArena(self.typed_states)
+        forward_layer = [forward.add(-1, root_state, root_key, 0)]
+        backward_layer = [backward.add(-1, state, key, 0) for state, key in self.generate_pull_roots()]
+        forward_visited = {root_state: forward_layer[0]}
+        backward_visited = {backward.states[index]: index for index in backward_layer}
+
+        meeting = None
+        if root_state in backward_visited:
+            meeting = (forward_layer[0], backward_visited[root_state])
+
+        while meeting is None and forward_layer and backward_layer:
+            if len(forward_layer) <= len(backward_layer):
+                forward_layer, meeting = self.expand_layer(forward_layer, forward, forward_visited, backward_visited,
+                                                           self.generate_pushes)
+            else:
+                backward_layer, meeting = self.expand_layer(backward_layer, backward, backward_visited, forward_visited,
+                                                            self.generate_pulls)
+                if meeting is not None:
+                    meeting = meeting[::-1]
+            self.to_be_visited = deque(forward_layer + backward_layer)
+
+        self.stats.arena_bytes = forward.nbytes() + backward.nbytes()
+        if meeting is None:
+            return None
+
+        forward_index, backward_index = meeting
+        # The backward path runs from the goal layout to the meeting state
+        return forward.path(forward_index) + backward.path(backward_index)[-2::-1]
+
+    def walk(self, agent_index, target_index, boxes):
+        # Shortest sequence of non-pushing moves taking the agent to target_index
+        parents = {agent_index: None}
+        frontier = deque([agent_index])
+        while frontier:
+            index = frontier.popleft()
+            if index == target_index:
+                break
+            for i, next_index in enumerate(self.neighbours[index]):
+                if next_index is None or next_index in parents or next_index in boxes:
+                    continue
+                parents[next_index] = (index, i)
+                frontier.append(next_index)
 
-    def find_path(self, node: Node):
-        visited_states = [node.state]
-        while node.parent_node is not None:
-            node = node.parent_node
-            visited_states.append(node.state)
+        moves = ""
+        index = target_index
+        while parents[index] is not None:
+            index, i = parents[index]
+            moves = MOVE_LETTERS[i].lower() + moves
+        return moves
 
-        visited_states.reverse()
+    def find_push_path(self, visited_states):
+        agent_index = self.agent_state
 
         moves = ""
-        for i, state in enumerate(visited_states):
-            if i != len(visited_states) - 1:
-                agent_index = round((state % 1) * 100)
-                agent_pos = self.index2pos[agent_index]
-
-                next_state = visited_states[i+1]
-                next_agent_index = round((next_state % 1) * 100)
-                next_agent_pos = self.index2pos[next_agent_index]
+        for state, next_state in zip(visited_states, visited_states[1:]):
+            boxes = set(self.boxes_combinatorics.unrank(self.decode_state(state)[0]))
+            next_boxes = set(self.boxes_combinatorics.unrank(self.decode_state(next_state)[0]))
+
+            box_index = (boxes - next_boxes).pop()
+            new_box_index = (next_boxes - boxes).pop()
+            neighbours = self.neighbours[box_index]
+            i = neighbours.index(new_box_index)
+
+            # The agent walks behind the box and pushes it once
+            moves += self.walk(agent_index, neighbours[(i + 2) % 4], boxes)
+            moves += MOVE_LETTERS[i]
+            agent_index = box_index
+        return moves
 
-                move = next_agent_pos - agent_pos
+    def find_states_path(self, visited_states):
+        start = time.perf_counter()
+        # Push-level states only keep the canonical agent position, so the walks between pushes are rebuilt
+        if self.push_level:
+            moves = self.find_push_path(visited_states)
+        else:
+            moves = self.find_move_path(visited_states)
+        self.stats.phase_times["reconstruction"] += time.perf_counter() - start
+        return moves
 
-                boxes_moved = math.floor(next_state) != math.floor(state)
+    def find_move_path(self, visited_states):
+        moves = ""
+        for state, next_state in zip(visited_states, visited_states[1:]):
+            boxes_state, agent_index = self.decode_state(state)
+            next_boxes_state, next_agent_index = self.decode_state(next_state)
 
-                dir = self.move2dir[move] if boxes_moved else self.move2dir[move].lower()
-                moves += dir
+            move = MOVE_LETTERS[self.neighbours[agent_index].index(next_agent_index)]
+            moves += move if next_boxes_state != boxes_state else move.lower()
         return moves
 
-    def trail(self, node: Node):
+    def trail(self, index):
         trail = []
 
-        c_node = node
-        while c_node.parent_node is not None:
-            c_node = c_node.parent_node
-            agent_state = round((c_node.state % 1) * 100)
+        index = self.arena.parents[index]
+        while index != -1:
+            _, agent_state = self.decode_state(self.arena.states[index])
             agent_pos = self.index2pos[agent_state]
             trail.append(agent_pos)
+            index = self.arena.parents[index]
 
         return trail
 
     def solution_found(self, solution: str):
-        print("Solution:", solution)
-        print("# Moves:",len(solution))
-        print("# Visited nodes:",len(self.visited_nodes))
-        print("# To be visited nodes:",len(self.to_be_visited))
-        sim = Simulation(self.environment, self.index2pos[self.agent_state], solution)
-        #print("Press SPACE to run simulation.")
-        sim.run()
-
-    def insert(self, child: Node):
-        insertion_point = 0
-        for i, el in enumerate(self.to_be_visited):
-            if child.cost >= el.cost:
-                insertion_point = i + 1
-            else:
-                break
+        if self.verbose:
+            print("Solution:", solution)
+            print("# Moves:",len(solution))
+            print("# Visited nodes:",self.num_expanded)
+            print("# To be visited nodes:",len(self.to_be_visited))
+        if self.visualize:
+            from simulation import Simulation
+            sim = Simulation(self.environment, self.index2cell[self.agent_state], solution)
+            #print("Press SPACE to run simulation.")
+            sim.run()
+
+    def insert(self, cost, index):
+        # Ties on cost are broken by arena index, which is the insertion order and keeps the heap stable
+        heapq.heappush(self.to_be_visited, (cost, index))
+
+    def expand(self, state, depth, key, with_cost=False):
+        # Returns the children as (state, key, cost) tuples at depth + 1
+        # Expansion time excludes the heuristic, which has its own phase
+        start = time.perf_counter()
+        heuristic_time = self.stats.phase_times["heuristic"]
+        if self.push_level:
+            children = self.generate_pushes(state, depth, key, with_cost)
+        else:
+            children = self.generate_children(state, depth, key, with_cost)
+        heuristic_time = self.stats.phase_times["heuristic"] - heuristic_time
+        self.stats.phase_times["expansion"] += time.perf_counter() - start - heuristic_time
+        self.stats.num_generated += len(children)
+        return children
 
-        self.to_be_visited.insert(insertion_point, child)
+    def sorted_children(self, state, depth, key):
+        # Cheapest children first, ties keep the generation order
+        return iter(sorted(self.expand(state, depth, key, with_cost=True), key=lambda child: child[2]))
+
+    def bounded_search(self, root_state, root_key, bound):
+        # Depth first search over nodes with f <= bound, keeping only the current path in memory.
+        # Returns the states of the path to a goal (or None) and the next bound.
+        next_bound = math.inf
+        on_path = {root_key}
+        cache = TranspositionTable(self.ida_cache_budget) if self.ida_cache_budget else None
+        stack = [(root_state, root_key, self.sorted_children(root_state, 0, root_key))]
+
+        while stack:
+            _, key, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                on_path.discard(key)
+                continue
 
-    def search(self, algorithm: Algorithms):
-        print("\nRunning", algorithm.value, "...")
+            child_state, child_key, cost = child
+            depth = len(stack)
+            if cost > bound:
+                next_bound = min(next_bound, cost)
+                continue
+            if child_key in on_path:
+                self.stats.num_duplicates += 1
+                continue
+            # The cache only holds states of this iteration, an earlier bound may have cut them off
+            if cache is not None:
+                best_depth = cache.get(child_key)
+                if best_depth is not None and best_depth <= depth:
+                    self.stats.num_duplicates += 1
+                    continue
+                cache.put(child_key, depth)
+
+            self.stats.expanded(len(stack), depth)
+            if self.decode_state(child_state)[0] == self.goal_state:
+                return [state for state, _, _ in stack] + [child_state], bound
+
+            on_path.add(child_key)
+            stack.append((child_state, child_key, self.sorted_children(child_state, depth, child_key)))
+
+        return None, next_bound
+
+    def iterative_deepening(self, root_state, root_key):
+        self.stats.expanded(0, 0)
+        if self.decode_state(root_state)[0] == self.goal_state:
+            return [root_state]
+
+        bound = self.calculate_cost(self.decode_state(root_state)[0], 0)
+        while bound != math.inf:
+            visited_states, bound = self.bounded_search(root_state, root_key, bound)
+            if visited_states is not None:
+                return visited_states
+        return None
+
+    def search(self, algorithm: Algorithms, push_level=False):
+        if self.verbose:
+            print("\nRunning", algorithm.value, "(pushes)" if push_level else "", "...")
 
         self.environment = deepcopy(self.initial_environment)
-        init_state = self.boxes_state + self.agent_state / 100
-        root = Node(None, init_state, 0, 0)
-        self.to_be_visited = deque([root])
-        self.to_be_visited_lookup = {}
-        self.visited_nodes = {}
+        self.stats.reset()
+        # The bidirectional search meets on push-level states
+        push_level = push_level or algorithm == Algorithms.Bidirectional
+        self.push_level = push_level
+        agent_state = self.agent_state
+        if push_level:
+            agent_state = self.normalize_agent(self.agent_state, set(self.boxes_combinatorics.unrank(self.boxes_state)))
+        root_state = self.encode_state(self.boxes_state, agent_state)
+        root_key = self.zobrist.hash(self.boxes_combinatorics.unrank(self.boxes_state), agent_state)
+
+        self.to_be_visited = deque()
+        if algorithm == Algorithms.IDAStar:
+            visited_states = self.iterative_deepening(root_state, root_key)
+        elif algorithm == Algorithms.ParallelAStar:
+            cost = self.calculate_cost(self.boxes_state, 0)
+            visited_states = None
+            if cost != math.inf:
+                visited_states = ParallelSearch(self, self.num_workers).run(root_state, root_key, cost)
+        # Move level BFS expands whole layers of packed states at once
+        elif algorithm == Algorithms.BFS and not push_level and BatchedBFS.fits(self):
+            visited_states = BatchedBFS(self).run(root_state)
+        elif algorithm == Algorithms.Bidirectional:
+            visited_states = self.bidirectional_search(root_state, root_key)
+        else:
+            visited_states = self.graph_search(algorithm, root_state, root_key)
+
+        if visited_states is None:
+            return
+        if self.verbose:
+            print("Found goal state. WIN :)")
+        solution = self.find_states_path(visited_states)
+        self.solution_found(solution)
+        return solution
+
+    def graph_search(self, algorithm, root_state, root_key):
+        # BFS, DFS and A*, returns the states from the root to a goal
+        # Nodes live in the arena, the open list only holds their indices
+        self.arena = NodeArena(self.typed_states)
+        root = self.arena.add(-1, root_state, root_key, 0)
+        with_cost = algorithm == Algorithms.AStar
+        if algorithm == Algorithms.AStar:
+            self.to_be_visited = []
+            self.insert(0, root)
+        else:
+            self.to_be_visited = deque([root])
+        # BFS and DFS close states through the table, so they stop when it is full instead of losing one.
+        # A* keeps the shallow entries, a popped node whose entry was evicted is simply expanded again
+        self.transposition_table = TranspositionTable(self.transposition_budget, evict=with_cost)
+        self.transposition_table.put(root_key, 0)
 
         while self.to_be_visited:
 
-            c_node = self.to_be_visited.popleft()
+            if algorithm == Algorithms.AStar:
+                index = heapq.heappop(self.to_be_visited)[1]
+            else:
+                index = self.to_be_visited.popleft()
+            depth = self.arena.g[index]
+            key = self.arena.keys[index]
+
+            # Entries superseded by a cheaper path to the same state are skipped lazily
+            best_depth = self.transposition_table.get(key)
+            if best_depth is not None and best_depth < depth:
+                self.stats.num_duplicates += 1
+                continue
 
-            self.visited_nodes[c_node.state] = 1
-            if math.floor(c_node.state) == self.goal_state:
-                print("Found goal state. WIN :)")
-                solution = self.find_path(c_node)
-                self.solution_found(solution)
-                break
+            self.stats.expanded(len(self.to_be_visited), depth)
+            state = self.arena.states[index]
+            if self.decode_state(state)[0] == self.goal_state:
+                self.stats.arena_bytes = self.arena.nbytes()
+                return self.arena.path(index)
 
-            children = self.generate_children(c_node, with_cost=(algorithm == Algorithms.AStar))
+            children = self.expand(state, depth, key, with_cost)
 
             # appending the new node to the to be visited list will make it a breath first search (FIFO)
             # adding the new node to the front of the to be visited list will make it depth first search (LIFO)
 
-            for child in children:
-                if self.visited_nodes.get(child.state) is None:
-                    # check look up of to_be_visited states to avoid adding duplicate states
-                    if self.to_be_visited_lookup.get(child.state) is None:
-                        if algorithm == Algorithms.BFS:
-                            self.to_be_visited.append(child)
-                        elif algorithm == Algorithms.DFS:
-                            self.to_be_visited.appendleft(child)
-                        elif algorithm == Algorithms.AStar:
-                            self.insert(child)
-                        else:
-                            raise RuntimeError("Choose an algorithm for the search.")
-                        self.to_be_visited_lookup[child.state] = 1
-
-
-
-
-
-while True:
-    mg = MapGenerator(10,10)
-    #map_path = os.path.join(os.path.pardir, "maps", "map.txt")
-    s = Search("generated_map.txt")
-    #s.search(Algorithms.BFS)
-    #s.search(Algorithms.DFS)
-    s.search(Algorithms.AStar)
-    input()
-map_path = os.path.join(os.path.pardir, "maps", "map.txt")
-s = Search(map_path)
-s.search(Algorithms.BFS)
-s.search(Algorithms.DFS)
-s.search(Algorithms.AStar)
+            child_depth = depth + 1
+            for child_state, child_key, cost in children:
+                # A* revisits a state only when a cheaper path to it is found, BFS and DFS never revisit one
+                best_depth = self.transposition_table.get(child_key)
+                if best_depth is not None and (not with_cost or best_depth <= child_depth):
+                    self.stats.num_duplicates += 1
+                    continue
+
+                child = self.arena.add(index, child_state, child_key, child_depth)
+                if algorithm == Algorithms.BFS:
+                    self.to_be_visited.append(child)
+                elif algorithm == Algorithms.DFS:
+                    self.to_be_visited.appendleft(child)
+                elif algorithm == Algorithms.AStar:
+                    self.insert(cost, child)
+                else:
+                    raise RuntimeError("Choose an algorithm for the search.")
+                self.transposition_table.put(child_key, child_depth)
+
+        self.stats.arena_bytes = self.arena.nbytes()
+        return None
+
+
+if __name__ == "__main__":
+    from level_generator import ReverseLevelGenerator
+    from portfolio import Portfolio
+
+    while True:
+        # Levels pulled backwards from the goals are always solvable
+        level = ReverseLevelGenerator(10, 10).generate()
+        with open("generated_map.txt", 'w') as map_file:
+            map_file.write(level.map_text)
+        #map_path = os.path.join(os.path.pardir, "maps", "map.txt")
+        portfolio = Portfolio("generated_map.txt")
+        solution = portfolio.solve()
+        for stats in portfolio.stats:
+            print(stats)
+        if solution is not None:
+            Search("generated_map.txt").solution_found(solution)
+        input()
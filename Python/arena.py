@@ -0,0 +1,41 @@
+from array import array
+
+
+class NodeArena:
+    """
+    Search nodes stored as a struct of arrays instead of one object per node.
+
+    Node i has parents[i] (index of its parent, -1 for a root), states[i], keys[i] (Zobrist)
+    and g[i]. The typed arrays grow geometrically as nodes are added, and open and closed
+    lists refer to nodes by index. States are kept in a Python list when packed states do not
+    fit in 64 bits.
+    """
+    def __init__(self, typed_states=True):
+        self.parents = array('q')
+        self.states = array('q') if typed_states else []
+        self.keys = array('Q')
+        self.g = array('l')
+
+    def __len__(self):
+        return len(self.parents)
+
+    def add(self, parent, state, key, g):
+        self.parents.append(parent)
+        self.states.append(state)
+        self.keys.append(key)
+        self.g.append(g)
+        return len(self.parents) - 1
+
+    def path(self, index):
+        # States from the root to node index
+        states = []
+        while index != -1:
+            states.append(self.states[index])
+            index = self.parents[index]
+        states.reverse()
+        return states
+
+    def nbytes(self):
+        # Bytes held by the nodes, without the over-allocation of the arrays and a states list
+        return sum(buffer.itemsize * len(buffer) for buffer in (self.parents, self.keys, self.g)) + \
+            (self.states.itemsize * len(self.states) if isinstance(self.states, array) else 0)
@@ -0,0 +1,166 @@
+import argparse
+import glob
+import json
+import multiprocessing
+from multiprocessing import connection
+import os
+import resource
+import signal
+import sys
+import time
+from dataclasses import asdict
+from defines import *
+from SokobanSearch import Algorithms
+from cache import SolutionCache
+from level_pack import LevelPack
+from solver import solve
+from stats import SearchStats
+from validator import SolutionValidator
+
+
+class BatchSolver:
+    """
+    Solves a collection of maps with a pool of worker processes, one map per process.
+
+    Each map gets its own time limit (seconds) and memory limit (bytes of address space), so a
+    map that runs over is stopped without holding up the rest. A JSON line is written for
+    every map as soon as it is finished, in completion order.
+    """
+    def __init__(self, map_paths, algorithm=Algorithms.AStar, push_level=False, num_workers=None,
+                 time_limit=None, memory_limit=None, output=sys.stdout, cache_path=None, validate=False,
+                 pattern_database_directory=None, report_interval=None):
+        self.map_paths = map_paths
+        self.algorithm = algorithm
+        self.push_level = push_level
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.time_limit = time_limit
+        self.memory_limit = memory_limit
+        self.output = output
+        self.cache_path = cache_path
+        # Every solution found is replayed and the record gets its validation
+        self.validate = validate
+        self.pattern_database_directory = pattern_database_directory
+        # Seconds between progress reports of every running search on standard error, None for no reports
+        self.report_interval = report_interval
+
+    @staticmethod
+    def find_maps(patterns):
+        # Directories are searched for .txt maps and level packs, anything else is taken as a glob.
+        # Every level of a pack is named "path#n", so each one is solved in its own process
+        paths = []
+        for pattern in patterns:
+            if os.path.isdir(pattern):
+                for extension in (".txt",) + LEVEL_PACK_EXTENSIONS:
+                    paths += sorted(glob.glob(os.path.join(pattern, "*" + extension)))
+            elif LevelPack.is_level_name(pattern):
+                paths.append(pattern)
+            else:
+                paths += sorted(glob.glob(pattern))
+        map_paths = []
+        for path in paths:
+            map_paths += LevelPack.level_names(path) if LevelPack.is_pack(path) else [path]
+        return map_paths
+
+    def run(self):
+        context = multiprocessing.get_context('fork')
+        waiting = list(self.map_paths)
+        # receiver -> (map path, process, start time), every worker sends its record over its own pipe,
+        # so stopping one worker can never lose or corrupt the record of another
+        running = {}
+
+        try:
+            while waiting or running:
+                while waiting and len(running) < self.num_workers:
+                    map_path = waiting.pop(0)
+                    receiver, sender = context.Pipe(duplex=False)
+                    # Not a daemon, so Parallel A* can start its own workers
+                    process = context.Process(target=self.work, args=(map_path, sender))
+                    process.start()
+                    sender.close()
+                    running[receiver] = (map_path, process, time.time())
+
+                for receiver in connection.wait(list(running), timeout=0.05):
+                    map_path, process, started = running.pop(receiver)
+                    try:
+                        record = receiver.recv()
+                    except EOFError:
+                        # The process died without a record, e.g. killed for memory
+                        record = {"map": map_path, "status": "failed", "time": time.time() - started}
+                    receiver.close()
+                    process.join()
+                    self.report(record)
+
+                # Deadlines are checked on every pass, however many records come in
+                now = time.time()
+                for receiver, (map_path, process, started) in list(running.items()):
+                    # A record already sent is read on the next pass instead
+                    if self.time_limit is None or now - started <= self.time_limit or receiver.poll():
+                        continue
+                    process.terminate()
+                    process.join()
+                    receiver.close()
+                    del running[receiver]
+                    self.report({"map": map_path, "status": "timeout", "time": now - started})
+        finally:
+            # Workers are not daemons, so they are stopped here if the batch ends early
+            for receiver, (map_path, process, started) in running.items():
+                process.terminate()
+                process.join()
+                receiver.close()
+
+    def report(self, record):
+        self.output.write(json.dumps(record) + "\n")
+        self.output.flush()
+
+    def work(self, map_path, sender):
+        # A terminated worker exits through multiprocessing, which also stops the Parallel A* workers it started
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+        if self.memory_limit is not None:
+            resource.setrlimit(resource.RLIMIT_AS, (self.memory_limit, self.memory_limit))
+        map_text = LevelPack.read_level(map_path)
+        # The time limit is kept by the pool, the search itself runs unlimited in this process
+        cache = SolutionCache(self.cache_path) if self.cache_path is not None else None
+        stats = None
+        if self.report_interval is not None:
+            stats = SearchStats(callback=lambda stats: print(map_path, SearchStats.format_report(stats),
+                                                             file=sys.stderr, flush=True),
+                                report_interval=self.report_interval)
+        result = solve(map_text, self.algorithm, push_level=self.push_level, cache=cache,
+                       pattern_database_directory=self.pattern_database_directory, stats=stats)
+        record = {"map": map_path, **asdict(result)}
+        if self.validate and result.solution is not None:
+            record["validation"] = asdict(SolutionValidator(map_text).replay(result.solution))
+        sender.send(record)
+        sender.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve a collection of Sokoban maps, one JSON line per map.")
+    parser.add_argument("maps", nargs="+", help="map files, level packs, path#n for level n of a pack, "
+                                                "directories or glob patterns")
+    parser.add_argument("--algorithm", default=Algorithms.AStar.value,
+                        choices=[algorithm.value for algorithm in Algorithms])
+    parser.add_argument("--push-level", action="store_true", help="search over pushes instead of moves")
+    parser.add_argument("--workers", type=int, default=None, help="number of maps solved at once")
+    parser.add_argument("--time-limit", type=float, default=None, help="seconds per map")
+    parser.add_argument("--memory-limit", type=int, default=None, help="megabytes per map")
+    parser.add_argument("--output", default=None, help="JSON lines file, standard output by default")
+    parser.add_argument("--cache", default=None, help="SQLite file caching the solutions")
+    parser.add_argument("--validate", action="store_true", help="replay every solution and report its validation")
+    parser.add_argument("--pattern-databases", nargs="?", const=PATTERN_DATABASE_DIRECTORY, default=None,
+                        help="directory of the tables built by pattern_database.py, " + PATTERN_DATABASE_DIRECTORY +
+                             " if none is given")
+    parser.add_argument("--report-interval", type=float, default=None,
+                        help="seconds between progress reports of the running searches on standard error")
+    args = parser.parse_args()
+
+    memory_limit = args.memory_limit * 1024 * 1024 if args.memory_limit is not None else None
+    output = open(args.output, 'w') if args.output is not None else sys.stdout
+    solver = BatchSolver(BatchSolver.find_maps(args.maps), Algorithms(args.algorithm), args.push_level,
+                         args.workers, args.time_limit, memory_limit, output, args.cache, args.validate,
+                         args.pattern_databases, args.report_interval)
+    solver.run()
+
+
+if __name__ == "__main__":
+    main()
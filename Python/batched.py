@@ -0,0 +1,139 @@
+import time
+import numpy as np
+from transposition import BudgetExceeded
+
+
+class BatchedBFS:
+    """
+    Move level breadth first search that expands a whole depth layer at once.
+
+    A layer is a NumPy array of packed states (boxes_state * num_spaces + agent - 1). The box
+    layouts of a layer are unranked together, the four moves are applied with lookups into
+    the neighbour table, and the children are ranked back into packed states. Children are
+    deduplicated with np.unique and against the sorted array of every state seen so far, and
+    each layer keeps the index of every state's parent in the previous layer.
+    Freeze and block deadlocks are still checked one push at a time.
+    The layers and the seen states are kept within the transposition budget of the search,
+    BudgetExceeded is raised when they outgrow it.
+    """
+    def __init__(self, search):
+        self.search = search
+        self.stats = search.stats
+        self.num_spaces = search.num_spaces
+        self.neighbours = search.board.neighbours
+        self.dead_squares = np.array(search.dead_squares, dtype=bool)
+        self.binomials = np.array(search.boxes_combinatorics.binomials, dtype=np.int64)
+        self.goal_state = search.goal_state
+        self.memory_budget = search.transposition_budget
+
+    @staticmethod
+    def fits(search):
+        # Packed states have to fit in an int64
+        return search.num_boxes > 0 and search.boxes_combinatorics.num_states * search.num_spaces < 2 ** 62
+
+    def unrank(self, boxes_states):
+        # Vectorized BoxCombinatorics.unrank, one sorted row of box indices per state
+        num_boxes = self.binomials.shape[1] - 1
+        boxes = np.empty((len(boxes_states), num_boxes), dtype=np.int64)
+        remainder = boxes_states - 1
+        for k in range(num_boxes, 0, -1):
+            # Largest c with C(c, k) <= remainder, the binomials grow with c
+            candidate = np.searchsorted(self.binomials[:, k], remainder, side='right') - 1
+            remainder = remainder - self.binomials[candidate, k]
+            boxes[:, k - 1] = candidate + 1
+        return boxes
+
+    def rank(self, boxes):
+        # Vectorized BoxCombinatorics.rank of sorted rows of box indices
+        state = np.ones(len(boxes), dtype=np.int64)
+        for i in range(boxes.shape[1]):
+            state += self.binomials[boxes[:, i] - 1, i + 1]
+        return state
+
+    def expand_layer(self, states):
+        # Returns the children of every state and the index of their parent in states
+        boxes_states, agents = np.divmod(states, self.num_spaces)
+        agents += 1
+        boxes = self.unrank(boxes_states)
+        parent_indices = np.arange(len(states))
+        deadlock_detector = self.search.deadlock_detector
+
+        children = []
+        parents = []
+        for i in range(4):
+            new_agents = self.neighbours[agents, i]
+            pushed = boxes == new_agents[:, None]
+            is_push = pushed.any(axis=1)
+            new_box_cells = self.neighbours[new_agents, i]
+            # Boxes can not be pushed into walls or into each other
+            blocked = is_push & ((new_box_cells == 0) | (boxes == new_box_cells[:, None]).any(axis=1))
+            # A box pushed onto a dead square can never reach a goal
+            dead = is_push & ~blocked & self.dead_squares[new_box_cells]
+            valid = (new_agents != 0) & ~blocked & ~dead
+            self.stats.prunes["dead_square"] += int(np.count_nonzero(dead & (new_agents != 0)))
+
+            new_boxes = np.where(pushed, new_box_cells[:, None], boxes)[valid]
+            new_agents = new_agents[valid]
+            new_box_cells = new_box_cells[valid]
+            valid_parents = parent_indices[valid]
+            # Only a push can create a freeze or block deadlock, and only around the pushed box
+            keep = np.ones(len(new_boxes), dtype=bool)
+            for j in np.nonzero(is_push[valid])[0].tolist():
+                deadlock_type = deadlock_detector.deadlock_type(int(new_box_cells[j]), set(new_boxes[j].tolist()))
+                if deadlock_type is not None:
+                    self.stats.prunes[deadlock_type] += 1
+                    keep[j] = False
+
+            new_boxes = np.sort(new_boxes[keep], axis=1)
+            children.append(self.rank(new_boxes) * self.num_spaces + new_agents[keep] - 1)
+            parents.append(valid_parents[keep])
+        return np.concatenate(children), np.concatenate(parents)
+
+    def run(self, root_state):
+        # Returns the states from the root to a goal, or None if every reachable state was searched
+        layers = [(np.array([root_state], dtype=np.int64), np.array([-1]))]
+        visited = layers[0][0]
+        layers_bytes = 0
+        goal = None
+        if root_state // self.num_spaces == self.goal_state:
+            goal = 0
+
+        while goal is None and len(layers[-1][0]):
+            states = layers[-1][0]
+            start = time.perf_counter()
+            children, parents = self.expand_layer(states)
+            num_children = len(children)
+            num_expanded = self.stats.num_expanded
+            self.stats.num_expanded += len(states)
+            self.stats.num_generated += num_children
+
+            children, first = np.unique(children, return_index=True)
+            parents = parents[first]
+            positions = np.minimum(np.searchsorted(visited, children), len(visited) - 1)
+            new = visited[positions] != children
+            children, parents = children[new], parents[new]
+            self.stats.num_duplicates += num_children - len(children)
+            # Both arrays are sorted and disjoint, so the children are merged in without a sort
+            visited = np.insert(visited, np.searchsorted(visited, children), children)
+            layers.append((children, parents))
+            layers_bytes += children.nbytes + parents.nbytes
+            if layers_bytes + visited.nbytes > self.memory_budget:
+                raise BudgetExceeded("batched BFS is over its budget of " + str(self.memory_budget) + " bytes")
+            self.stats.phase_times["expansion"] += time.perf_counter() - start
+            # Sampled when the layer passes a multiple of sample_interval, as in one node at a time search
+            interval = self.stats.sample_interval
+            if num_expanded // interval != self.stats.num_expanded // interval:
+                self.stats.sample(len(children), len(layers) - 1)
+
+            goals = np.nonzero(children // self.num_spaces == self.goal_state)[0]
+            if len(goals):
+                goal = int(goals[0])
+
+        if goal is None:
+            return None
+        visited_states = []
+        for states, parents in reversed(layers):
+            visited_states.append(int(states[goal]))
+            goal = int(parents[goal])
+        visited_states.reverse()
+        return visited_states
@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from dataclasses import asdict
+from defines import *
+from MapGenerator import MapGenerator
+from SokobanSearch import Algorithms
+from level_pack import LevelPack
+from solver import solve, Limits
+
+MAPS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.pardir, "maps")
+CORPUS_MAPS = ["map.txt", "map1.txt"]
+CORPUS_SEEDS = range(5)
+
+
+class Benchmark:
+    """
+    Runs every Algorithms mode, at move and at push level, over a fixed corpus: the maps in
+    maps/, a set of maps generated from fixed seeds and any extra levels (map files or levels of
+    a pack named "path#n"). Every run is a forked process with a
+    time limit, so peak RSS is measured per run. Each mode is run repeats times and the run with
+    the median time is kept, a mode that times out is not repeated.
+    """
+    def __init__(self, time_limit=30, seeds=CORPUS_SEEDS, size=10, levels=(), repeats=3,
+                 pattern_database_directory=None):
+        self.time_limit = time_limit
+        self.repeats = repeats
+        self.seeds = seeds
+        self.size = size
+        self.levels = levels
+        self.pattern_database_directory = pattern_database_directory
+
+    def corpus(self):
+        maps = {}
+        for name in CORPUS_MAPS:
+            with open(os.path.join(MAPS_DIRECTORY, name), 'r') as map_file:
+                maps[name] = map_file.read()
+        for seed in self.seeds:
+            generator = MapGenerator(self.size, self.size, seed=seed, map_file_path=None, verbose=False)
+            maps["generated_" + str(seed)] = generator.to_text()
+        for name in self.levels:
+            maps[name] = LevelPack.read_level(name)
+        return maps
+
+    @staticmethod
+    def modes():
+        # Bidirectional always searches over pushes
+        for algorithm in Algorithms:
+            for push_level in (False, True):
+                if algorithm == Algorithms.Bidirectional and not push_level:
+                    continue
+                yield algorithm, push_level
+
+    def run(self, verbose=True):
+        runs = []
+        for name, map_text in self.corpus().items():
+            for algorithm, push_level in self.modes():
+                results = []
+                while len(results) < self.repeats:
+                    results.append(solve(map_text, algorithm, Limits(time=self.time_limit), push_level=push_level,
+                                         pattern_database_directory=self.pattern_database_directory))
+                    if results[-1].status == "timeout":
+                        break
+                results.sort(key=lambda result: result.time)
+                result = results[len(results) // 2]
+                run = {"map": name, "algorithm": algorithm.value, "push_level": push_level, **asdict(result)}
+                run["times"] = [result.time for result in results]
+                run["expansions_per_second"] = result.expanded / result.time if result.time > 0 else None
+                # Samples are left out to keep the results small
+                del run["solution"]
+                if run["stats"] is not None:
+                    del run["stats"]["samples"]
+                runs.append(run)
+                if verbose:
+                    print(Benchmark.format_run(run))
+        return {"created": time.time(), "python": platform.python_version(), "time_limit": self.time_limit,
+                "repeats": self.repeats, "pattern_databases": self.pattern_database_directory is not None,
+                "runs": runs}
+
+    @staticmethod
+    def format_run(run):
+        return "{:<14} {:<14} {:<6} {:<9} moves={} pushes={} expanded={} time={:.3f}s rss={}".format(
+            run["map"], run["algorithm"], "pushes" if run["push_level"] else "moves", run["status"],
+            run["moves"], run["pushes"], run["expanded"], run["time"], run["peak_rss"])
+
+    @staticmethod
+    def compare(baseline, current, tolerance=0.25, time_floor=0.1):
+        """
+        Lists the regressions of current against baseline. Runs are matched by map, algorithm
+        and level. Time, throughput and memory regress when they are worse by more than the
+        tolerance, solution quality and status regress on any change for the worse. The timing
+        tolerance grows by the relative spread of the repeated runs, and runs faster than
+        time_floor seconds in both results are too noisy for time and throughput checks.
+        Throughput and memory are compared for runs that timed out in both results as well.
+        """
+        baseline_runs = {Benchmark.run_key(run): run for run in baseline["runs"]}
+        regressions = []
+        for run in current["runs"]:
+            old = baseline_runs.get(Benchmark.run_key(run))
+            if old is None:
+                continue
+            name = " ".join(str(part) for part in Benchmark.run_key(run))
+            if old["status"] == "solved" and run["status"] != "solved":
+                regressions.append(name + ": " + old["status"] + " -> " + run["status"])
+                continue
+            if run["status"] != old["status"] or run["status"] not in ("solved", "timeout"):
+                continue
+            timed = max(old["time"], run["time"]) >= time_floor
+            timing_tolerance = tolerance + max(Benchmark.spread(old), Benchmark.spread(run))
+            if run["status"] == "solved":
+                for field in ("moves", "pushes"):
+                    if run[field] > old[field]:
+                        regressions.append("{}: {} {} -> {}".format(name, field, old[field], run[field]))
+                if timed and run["time"] > old["time"] * (1 + timing_tolerance):
+                    regressions.append("{}: time {:.4g} -> {:.4g}".format(name, old["time"], run["time"]))
+            if old["peak_rss"] and run["peak_rss"] and run["peak_rss"] > old["peak_rss"] * (1 + tolerance):
+                regressions.append("{}: peak_rss {:.4g} -> {:.4g}".format(name, old["peak_rss"], run["peak_rss"]))
+            if timed and old["expansions_per_second"] and \
+                    (run["expansions_per_second"] or 0) < old["expansions_per_second"] / (1 + timing_tolerance):
+                regressions.append("{}: expansions_per_second {:.4g} -> {:.4g}".format(
+                    name, old["expansions_per_second"], run["expansions_per_second"] or 0))
+        return regressions
+
+    @staticmethod
+    def spread(run):
+        # Relative difference between the slowest and the fastest repeat
+        times = run.get("times") or [run["time"]]
+        return (max(times) - min(times)) / run["time"] if run["time"] else 0
+
+    @staticmethod
+    def run_key(run):
+        return run["map"], run["algorithm"], "pushes" if run["push_level"] else "moves"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the solver and compare against a baseline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmark and save the results as JSON")
+    run_parser.add_argument("output", help="JSON file for the results")
+    run_parser.add_argument("--time-limit", type=float, default=30, help="seconds per run")
+    run_parser.add_argument("--seeds", type=int, default=len(CORPUS_SEEDS), help="number of generated maps")
+    run_parser.add_argument("--repeats", type=int, default=3, help="runs per mode, the median time is kept")
+    run_parser.add_argument("--pattern-databases", nargs="?", const=PATTERN_DATABASE_DIRECTORY, default=None,
+                            help="directory of the tables built by pattern_database.py, " + PATTERN_DATABASE_DIRECTORY +
+                                 " if none is given")
+    run_parser.add_argument("--levels", nargs="*", default=[],
+                            help="extra map files, level packs or path#n for level n of a pack")
+    compare_parser = commands.add_parser("compare", help="flag regressions against a baseline")
+    compare_parser.add_argument("baseline", help="JSON results of the baseline")
+    compare_parser.add_argument("current", help="JSON results to check")
+    compare_parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    compare_parser.add_argument("--time-floor", type=float, default=0.1,
+                                help="seconds below which times and throughput are not compared")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        levels = []
+        for name in args.levels:
+            levels += LevelPack.level_names(name) if LevelPack.is_pack(name) else [name]
+        results = Benchmark(args.time_limit, range(args.seeds), levels=levels, repeats=args.repeats,
+                            pattern_database_directory=args.pattern_databases).run()
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        return
+
+    with open(args.baseline, 'r') as file:
+        baseline = json.load(file)
+    with open(args.current, 'r') as file:
+        current = json.load(file)
+    regressions = Benchmark.compare(baseline, current, args.tolerance, args.time_floor)
+    for regression in regressions:
+        print("REGRESSION", regression)
+    if regressions:
+        sys.exit(1)
+    print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
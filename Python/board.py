@@ -0,0 +1,116 @@
+import numpy as np
+from defines import *
+
+# Row and column offsets in the order of possible_actions (LEFT, UP, RIGHT, DOWN)
+OFFSETS = ((0, -1), (-1, 0), (0, 1), (1, 0))
+
+
+class InvalidMap(ValueError):
+    pass
+
+
+class Board:
+    """
+    A map parsed once into a uint8 grid of its characters, with boolean masks for the walls,
+    goals, boxes and the agent (a filled goal counts as both a goal and a box, and the agent
+    may stand on a goal).
+
+    Spaces are numbered 1, 2, ... in row major order, index_map holds those indices and 0 for
+    walls. Everything is computed with array operations, without loops over the cells.
+    Rows shorter than the widest one are padded with walls. A map needs exactly one agent and
+    as many goals as boxes, InvalidMap is raised otherwise.
+    """
+    def __init__(self, map_text):
+        rows = [row for row in map_text.splitlines() if row]
+        if not rows:
+            raise InvalidMap("the map is empty")
+        self.rows = len(rows)
+        self.cols = max(len(row) for row in rows)
+        text = "".join(row.ljust(self.cols, WALL) for row in rows)
+        self.grid = np.frombuffer(text.encode('ascii'), dtype=np.uint8).reshape(self.rows, self.cols)
+
+        self.walls = self.grid == ord(WALL)
+        self.goals = (self.grid == ord(GOAL)) | (self.grid == ord(GOAL_FILLED)) | (self.grid == ord(AGENT_ON_GOAL))
+        self.boxes = (self.grid == ord(BOX)) | (self.grid == ord(GOAL_FILLED))
+        self.agent = (self.grid == ord(AGENT)) | (self.grid == ord(AGENT_ON_GOAL))
+
+        self.num_spaces = int(np.count_nonzero(~self.walls))
+        self.num_boxes = int(np.count_nonzero(self.boxes))
+        num_agents = int(np.count_nonzero(self.agent))
+        num_goals = int(np.count_nonzero(self.goals))
+        if num_agents != 1:
+            raise InvalidMap("the map has " + str(num_agents) + " agents instead of one")
+        if num_goals != self.num_boxes:
+            raise InvalidMap("the map has " + str(self.num_boxes) + " boxes and " + str(num_goals) + " goals")
+
+        self.index_map = np.zeros((self.rows, self.cols), dtype=np.int32)
+        self.index_map[~self.walls] = np.arange(1, self.num_spaces + 1)
+        # (row, col) of every space, row 0 stands for index 0
+        self.coordinates = np.vstack(([0, 0], np.argwhere(~self.walls)))
+        # Grid cell (row * cols + col) of every space, -1 for index 0
+        self.cells = np.concatenate(([-1], np.flatnonzero(~self.walls)))
+        self.neighbours = self.create_neighbour_array()
+
+    def environment(self):
+        # The characters as the chararray the simulation and display draw from
+        return self.grid.view('S1').astype('U1').view(np.chararray)
+
+    def indices(self, mask):
+        return self.index_map[mask].tolist()
+
+    @staticmethod
+    def shift(array, row_offset, col_offset, fill):
+        # shifted[r, c] = array[r + row_offset, c + col_offset], fill outside the board
+        pad = max(abs(row_offset), abs(col_offset), 1)
+        padded = np.pad(array, pad, constant_values=fill)
+        rows, cols = array.shape
+        return padded[pad + row_offset:pad + row_offset + rows, pad + col_offset:pad + col_offset + cols]
+
+    @staticmethod
+    def count_neighbour_walls(walls):
+        # Number of walls (or board edges) next to every cell
+        return sum(Board.shift(walls, row_offset, col_offset, True).astype(np.uint8)
+                   for row_offset, col_offset in OFFSETS)
+
+    def offset_indices(self, offsets):
+        # result[index, j] is the space at (row, col) offsets[j] from index, 0 if it is a wall
+        result = np.zeros((self.num_spaces + 1, len(offsets)), dtype=np.int32)
+        for j, (row_offset, col_offset) in enumerate(offsets):
+            result[1:, j] = Board.shift(self.index_map, row_offset, col_offset, 0)[~self.walls]
+        return result
+
+    def create_neighbour_array(self):
+        # neighbours[index, i] is the space reached from index by action i
+        return self.offset_indices(OFFSETS)
+
+    def push_distance_tables(self, goal_indices):
+        """
+        distances[g, index] is the number of pushes needed to move a single box from index onto
+        goal g, inf if it can not. All goals are searched at once by pulling layers of boxes
+        away from them: the box moves from a space to its neighbour while the agent needs the
+        space behind that neighbour.
+        """
+        num_goals = len(goal_indices)
+        distances = np.full((num_goals, self.num_spaces + 1), np.inf)
+        frontier = np.zeros((num_goals, self.num_spaces + 1), dtype=bool)
+        frontier[np.arange(num_goals), goal_indices] = True
+        distances[frontier] = 0
+
+        pulls = []
+        for i in range(4):
+            previous = self.neighbours[:, i]
+            behind = self.neighbours[previous, i]
+            valid = (previous != 0) & (behind != 0)
+            valid[0] = False
+            # Every space has at most one neighbour per direction, so the targets are unique
+            pulls.append((np.nonzero(valid)[0], previous[valid]))
+
+        depth = 0
+        while frontier.any():
+            depth += 1
+            reached = np.zeros_like(frontier)
+            for sources, targets in pulls:
+                reached[:, targets] |= frontier[:, sources]
+            frontier = reached & np.isinf(distances)
+            distances[frontier] = depth
+        return distances
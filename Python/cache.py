@@ -0,0 +1,118 @@
+import hashlib
+import json
+import sqlite3
+import time
+from defines import *
+
+# Direction letters as (dx, dy), pushes are the upper case letters
+DIRECTIONS = {'l': (-1, 0), 'u': (0, -1), 'r': (1, 0), 'd': (0, 1)}
+
+
+class MapFingerprint:
+    """
+    Canonical form of a map under the eight symmetries of the board (rotations and mirrors).
+
+    The canonical text is the smallest of the eight transformed maps, so symmetric maps share
+    one fingerprint. A solution is stored in the canonical orientation and mapped back with
+    the inverse of the symmetry that produced the canonical text.
+    """
+    def __init__(self, map_text):
+        rows = [row for row in map_text.splitlines() if row]
+        width = max(len(row) for row in rows)
+        # Ragged rows are padded with walls to the widest row, as in Board
+        rows = [row.ljust(width, WALL) for row in rows]
+
+        self.text, self.symmetry = min((MapFingerprint.transform_map(rows, symmetry), symmetry)
+                                       for symmetry in range(8))
+        self.key = hashlib.sha256(self.text.encode()).hexdigest()
+
+    @staticmethod
+    def transform_vector(x, y, symmetry):
+        # Bit 2 transposes, bit 0 mirrors x and bit 1 mirrors y, in that order
+        if symmetry & 4:
+            x, y = y, x
+        if symmetry & 1:
+            x = -x
+        if symmetry & 2:
+            y = -y
+        return x, y
+
+    @staticmethod
+    def transform_map(rows, symmetry):
+        if symmetry & 4:
+            rows = ["".join(column) for column in zip(*rows)]
+        if symmetry & 1:
+            rows = [row[::-1] for row in rows]
+        if symmetry & 2:
+            rows = rows[::-1]
+        return "\n".join(rows)
+
+    @staticmethod
+    def transform_solution(solution, symmetry, inverse=False):
+        letters = {}
+        for letter, (x, y) in DIRECTIONS.items():
+            new_letter = next(other for other, vector in DIRECTIONS.items()
+                              if vector == MapFingerprint.transform_vector(x, y, symmetry))
+            if inverse:
+                letter, new_letter = new_letter, letter
+            letters[letter] = new_letter
+            letters[letter.upper()] = new_letter.upper()
+        return "".join(letters[move] for move in solution)
+
+    def to_canonical(self, solution):
+        return MapFingerprint.transform_solution(solution, self.symmetry)
+
+    def from_canonical(self, solution):
+        return MapFingerprint.transform_solution(solution, self.symmetry, inverse=True)
+
+
+class SolutionCache:
+    """
+    Solutions stored in a SQLite file, keyed by map fingerprint and search configuration.
+
+    At most max_entries solutions are kept, the least recently used are evicted first.
+    Unsolvable maps are stored too, with the solution None.
+    """
+    def __init__(self, path, max_entries=SOLUTION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS solutions ("
+                                "key TEXT PRIMARY KEY, solution TEXT, stats TEXT, last_used REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS solutions_last_used ON solutions (last_used)")
+        self.connection.commit()
+
+    @staticmethod
+    def entry_key(fingerprint, configuration):
+        return fingerprint.key + ":" + configuration
+
+    def get(self, map_text, configuration):
+        # Returns (solution, stats), or None if the map is not cached
+        fingerprint = MapFingerprint(map_text)
+        key = SolutionCache.entry_key(fingerprint, configuration)
+        row = self.connection.execute("SELECT solution, stats FROM solutions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self.connection.execute("UPDATE solutions SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.connection.commit()
+
+        solution, stats = row
+        if solution is not None:
+            solution = fingerprint.from_canonical(solution)
+        return solution, json.loads(stats)
+
+    def put(self, map_text, configuration, solution, stats):
+        fingerprint = MapFingerprint(map_text)
+        key = SolutionCache.entry_key(fingerprint, configuration)
+        if solution is not None:
+            solution = fingerprint.to_canonical(solution)
+        self.connection.execute("INSERT OR REPLACE INTO solutions VALUES (?, ?, ?, ?)",
+                                (key, solution, json.dumps(stats), time.time()))
+        self.connection.execute("DELETE FROM solutions WHERE key IN (SELECT key FROM solutions "
+                                "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+        self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
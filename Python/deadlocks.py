@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from defines import *
+
+
+class DeadlockDetector:
+    """
+    Incremental deadlock checks around the box that was just pushed.
+
+    Only the boxes inside a small window around the pushed box are considered (boxes outside
+    it are treated as free), so the result depends on the local pattern alone and can be
+    memoized in a bounded LRU cache. Two patterns are detected, deadlock_type returns which:
+    - block: a 2x2 square of boxes and walls holding a box that is not on a goal
+    - freeze: the pushed box can not move along either axis, recursively through the
+      neighbouring boxes, while one of the frozen boxes is not on a goal
+    """
+    def __init__(self, board, neighbours, dead_squares, goal_indices, radius=2, cache_size=100000):
+        self.neighbours = neighbours
+        self.dead_squares = dead_squares
+        self.goal_indices = set(goal_indices)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+        # windows[index] are the spaces within radius of index, blocks[index] the other three
+        # spaces of each 2x2 square containing index (None for walls)
+        window_offsets = [(y, x) for y in range(-radius, radius + 1) for x in range(-radius, radius + 1)]
+        block_offsets = [offset for x, y in ((-1, -1), (1, -1), (1, 1), (-1, 1)) for offset in ((0, x), (y, 0), (y, x))]
+        self.windows = [tuple(index for index in row if index) for row in board.offset_indices(window_offsets).tolist()]
+        self.blocks = [tuple(tuple(index or None for index in row[i:i + 3]) for i in range(0, 12, 3))
+                       for row in board.offset_indices(block_offsets).tolist()]
+        self.windows[0] = self.blocks[0] = None
+
+    def deadlock_type(self, box_index, boxes_indices):
+        # "block", "freeze" or None when the pushed box is not deadlocked
+        window = self.windows[box_index]
+        pattern = 0
+        for i, index in enumerate(window):
+            if index in boxes_indices:
+                pattern |= 1 << i
+
+        key = (box_index, pattern)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        local_boxes = {index for index in window if index in boxes_indices}
+        deadlock_type = None
+        if self.is_block_deadlock(box_index, local_boxes):
+            deadlock_type = "block"
+        elif self.is_freeze_deadlock(box_index, local_boxes):
+            deadlock_type = "freeze"
+
+        self.cache[key] = deadlock_type
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return deadlock_type
+
+    def is_block_deadlock(self, box_index, boxes):
+        for block in self.blocks[box_index]:
+            if all(index is None or index in boxes for index in block):
+                block_boxes = [box_index] + [index for index in block if index is not None]
+                if any(index not in self.goal_indices for index in block_boxes):
+                    return True
+        return False
+
+    def is_freeze_deadlock(self, box_index, boxes):
+        frozen = self.frozen_boxes(box_index, boxes, set())
+        return frozen is not None and any(index not in self.goal_indices for index in frozen)
+
+    def frozen_boxes(self, box_index, boxes, checking):
+        # Returns the boxes that keep box_index from moving (itself included), or None if it can move.
+        # Boxes that are being checked further up the recursion count as walls.
+        checking.add(box_index)
+        frozen = {box_index}
+        for first_move, second_move in ((LEFT, RIGHT), (UP, DOWN)):
+            blocking = self.axis_blocking(box_index, boxes, checking, first_move, second_move)
+            if blocking is None:
+                frozen = None
+                break
+            frozen |= blocking
+        checking.discard(box_index)
+        return frozen
+
+    def axis_blocking(self, box_index, boxes, checking, first_move, second_move):
+        first = self.neighbours[box_index][first_move]
+        second = self.neighbours[box_index][second_move]
+        if first is None or second is None:
+            return set()
+        # Pushing the box either way along the axis would put it on a dead square
+        if self.dead_squares[first] and self.dead_squares[second]:
+            return set()
+        for side in (first, second):
+            if side in checking:
+                return set()
+            if side in boxes:
+                frozen = self.frozen_boxes(side, boxes, checking)
+                if frozen is not None:
+                    return frozen
+        return None
@@ -7,6 +7,7 @@ GOAL = 'G'
 GOAL_FILLED = 'F'
 WALL = 'X'
 PASSAGE = '.'
+AGENT_ON_GOAL = 'N'
 
 # ACTIONS
 LEFT = 0
@@ -14,6 +15,17 @@ UP = 1
 RIGHT = 2
 DOWN = 3
 possible_actions = [LEFT, UP, RIGHT, DOWN]
+# Letter of every action in a solution, upper case for a push
+MOVE_LETTERS = "LURD"
+
+# SEARCH
+TRANSPOSITION_BUDGET = 512 * 1024 * 1024  # bytes
+IDA_CACHE_BUDGET = 16 * 1024 * 1024  # bytes, 0 disables the IDA* cycle cache
+SOLUTION_CACHE_SIZE = 10000  # solutions kept in a SolutionCache
+PATTERN_DATABASE_DIRECTORY = "pattern_databases"
+
+# LEVEL PACKS
+LEVEL_PACK_EXTENSIONS = (".xsb", ".sok")  # files holding many levels, read with LevelPack
 
 # COLORS
 WHITE, BLACK = (255, 255, 255), (0, 0, 0),
@@ -0,0 +1,156 @@
+import hashlib
+import math
+import os
+from itertools import combinations
+import numpy as np
+from utilities import BoxCombinatorics
+
+# Table value of box layouts that can not reach the goals, distances above it are capped
+PATTERN_UNREACHABLE = 255
+
+
+class MatchingHeuristic:
+    """
+    Admissible lower bound on the number of pushes left to solve a box layout.
+
+    Every box is assigned to its own goal so that the summed push distances are minimal
+    (Hungarian algorithm). distances[g][index] is the number of pushes from index onto goal g,
+    as computed once per map by Board.push_distance_tables with a reverse BFS (pulling a box
+    away from each goal) that respects walls but ignores the other boxes. Estimates are cached
+    by box state.
+    """
+    def __init__(self, boxes_combinatorics, goal_indices, distances):
+        self.boxes_combinatorics = boxes_combinatorics
+        self.goal_indices = list(goal_indices)
+        self.distances = distances
+        self.cache = {}
+
+    def estimate(self, boxes_state):
+        cost = self.cache.get(boxes_state)
+        if cost is None:
+            boxes_indices = self.boxes_combinatorics.unrank(boxes_state)
+            cost = self.assignment_cost(boxes_indices)
+            self.cache[boxes_state] = cost
+        return cost
+
+    def assignment_cost(self, boxes_indices):
+        # Unreachable pairs get a cost no finite assignment can reach
+        unreachable = self.boxes_combinatorics.num_spaces * len(boxes_indices) + 1
+        cost_matrix = []
+        for box_index in boxes_indices:
+            row = [distances[box_index] for distances in self.distances]
+            if all(distance == math.inf for distance in row):
+                return math.inf
+            cost_matrix.append([unreachable if distance == math.inf else distance for distance in row])
+
+        cost = MatchingHeuristic.hungarian(cost_matrix)
+        return math.inf if cost >= unreachable else cost
+
+    @staticmethod
+    def hungarian(cost_matrix):
+        # Minimum cost perfect matching of a square matrix with row and column potentials
+        n = len(cost_matrix)
+        u = [0] * (n + 1)
+        v = [0] * (n + 1)
+        match = [0] * (n + 1)
+        way = [0] * (n + 1)
+        for row in range(1, n + 1):
+            match[0] = row
+            col = 0
+            min_value = [math.inf] * (n + 1)
+            used = [False] * (n + 1)
+            while True:
+                used[col] = True
+                matched_row = match[col]
+                delta = math.inf
+                next_col = 0
+                for j in range(1, n + 1):
+                    if not used[j]:
+                        reduced = cost_matrix[matched_row - 1][j - 1] - u[matched_row] - v[j]
+                        if reduced < min_value[j]:
+                            min_value[j] = reduced
+                            way[j] = col
+                        if min_value[j] < delta:
+                            delta = min_value[j]
+                            next_col = j
+                for j in range(n + 1):
+                    if used[j]:
+                        u[match[j]] += delta
+                        v[j] -= delta
+                    else:
+                        min_value[j] -= delta
+                col = next_col
+                if match[col] == 0:
+                    break
+            while col:
+                previous_col = way[col]
+                match[col] = match[previous_col]
+                col = previous_col
+        return -v[0]
+
+
+class PatternDatabaseHeuristic:
+    """
+    Additive lower bound from pattern databases, built offline by pattern_database.py.
+
+    tables[size][rank - 1] is the exact number of pushes needed to bring a layout of size boxes
+    onto any size goals with the other boxes removed and the agent placed anywhere. Splitting
+    the boxes into groups and adding the table values of the groups is admissible for every
+    split, so the best split is used, and never less than the matching bound.
+    The tables are memory mapped, so worker processes share their pages.
+    """
+    def __init__(self, matching_heuristic, tables):
+        self.matching_heuristic = matching_heuristic
+        self.boxes_combinatorics = matching_heuristic.boxes_combinatorics
+        self.tables = tables
+        self.group_size = max(tables)
+        num_spaces = self.boxes_combinatorics.num_spaces
+        self.group_combinatorics = {size: BoxCombinatorics(num_spaces, size) for size in tables}
+        self.cache = {}
+
+    @staticmethod
+    def table_path(directory, map_text, size):
+        fingerprint = hashlib.sha256("\n".join(map_text.splitlines()).encode()).hexdigest()[:16]
+        return os.path.join(directory, fingerprint + "_" + str(size) + ".npy")
+
+    @staticmethod
+    def load_tables(directory, map_text, num_boxes):
+        # Every group size up to the largest table is needed for the last, smaller group
+        tables = {}
+        for size in range(1, num_boxes + 1):
+            path = PatternDatabaseHeuristic.table_path(directory, map_text, size)
+            if not os.path.exists(path):
+                break
+            tables[size] = np.load(path, mmap_mode='r')
+        return tables
+
+    def estimate(self, boxes_state):
+        cost = self.cache.get(boxes_state)
+        if cost is None:
+            boxes_indices = self.boxes_combinatorics.unrank(boxes_state)
+            cost = max(self.matching_heuristic.estimate(boxes_state), self.pattern_cost(tuple(boxes_indices), {}))
+            self.cache[boxes_state] = cost
+        return cost
+
+    def pattern_cost(self, boxes_indices, memo):
+        # Best split of the boxes into groups, the group of the first box is chosen first
+        if not boxes_indices:
+            return 0
+        cost = memo.get(boxes_indices)
+        if cost is not None:
+            return cost
+
+        size = min(self.group_size, len(boxes_indices))
+        combinatorics = self.group_combinatorics[size]
+        table = self.tables[size]
+        first, rest = boxes_indices[0], boxes_indices[1:]
+        cost = -1
+        for others in combinations(rest, size - 1):
+            group_cost = int(table[combinatorics.rank((first,) + others) - 1])
+            if group_cost == PATTERN_UNREACHABLE:
+                cost = math.inf
+                break
+            remaining = tuple(index for index in rest if index not in others)
+            cost = max(cost, group_cost + self.pattern_cost(remaining, memo))
+        memo[boxes_indices] = cost
+        return cost
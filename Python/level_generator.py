@@ -0,0 +1,212 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+from collections import deque
+from dataclasses import dataclass, asdict
+from defines import *
+from SokobanSearch import Search, Algorithms
+from utilities import Utilities as utils
+
+
+@dataclass
+class Level:
+    map_text: str
+    solution: str
+    pushes: int
+    seed: object = None
+
+
+class ReverseLevelGenerator:
+    """
+    Generates levels that are solvable by construction.
+
+    The boxes start on their goals and the agent pulls them away, walking freely between two
+    pulls. A pull played backwards is a push, so the level is solvable in at most one push per
+    pull. push_depth pulls are made when possible, and a pull never undoes the one before it.
+    Pulls often cancel out, so every level is solved with the push level A* search and keeps
+    its optimal solution and number of pushes. Levels solved in fewer than min_pushes pushes
+    are rejected.
+    Cells are row * cols + col on the grid, as in Simulation.
+    """
+    def __init__(self, rows, cols, num_boxes=2, push_depth=10, wall_density=0.1, seed=None, max_attempts=100,
+                 min_pushes=0):
+        self.rows = rows
+        self.cols = cols
+        self.num_boxes = num_boxes
+        self.push_depth = push_depth
+        self.wall_density = wall_density
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.max_attempts = max_attempts
+        self.min_pushes = min_pushes
+        self.offsets, _ = utils.create_direction_tables(cols)
+
+    def generate(self):
+        for _ in range(self.max_attempts):
+            level = self.attempt()
+            if level is not None:
+                return level
+        raise RuntimeError("No level found, try fewer boxes, a lower wall density or fewer pushes.")
+
+    def create_room(self):
+        # Walls around the border and scattered inside, the largest region of free cells is kept
+        free = set()
+        for row in range(1, self.rows - 1):
+            for col in range(1, self.cols - 1):
+                if self.random.random() >= self.wall_density:
+                    free.add(row * self.cols + col)
+
+        room = set()
+        unvisited = set(free)
+        while unvisited:
+            region = set(self.reach(min(unvisited), free, set()))
+            unvisited -= region
+            if len(region) > len(room):
+                room = region
+        return room
+
+    def reach(self, start, free, boxes):
+        # parents[cell] is (previous cell, action) on a shortest walk from start, None for start
+        parents = {start: None}
+        frontier = deque([start])
+        while frontier:
+            cell = frontier.popleft()
+            for i, offset in enumerate(self.offsets):
+                next_cell = cell + offset
+                if next_cell in parents or next_cell not in free or next_cell in boxes:
+                    continue
+                parents[next_cell] = (cell, i)
+                frontier.append(next_cell)
+        return parents
+
+    def pulls(self, free, boxes, reachable, last_pull):
+        # (box, action) for every box the agent can pull one cell by stepping away with action
+        candidates = []
+        for box in sorted(boxes):
+            for i, offset in enumerate(self.offsets):
+                start = box + offset
+                end = start + offset
+                if start not in reachable or end not in free or end in boxes or (box, i) == last_pull:
+                    continue
+                candidates.append((box, i))
+        return candidates
+
+    def attempt(self):
+        free = self.create_room()
+        if len(free) < self.num_boxes + 2:
+            return None
+
+        cells = sorted(free)
+        goals = set(self.random.sample(cells, self.num_boxes))
+        boxes = set(goals)
+        agent = self.random.choice([cell for cell in cells if cell not in boxes])
+
+        last_pull = None
+        num_pulls = 0
+        while num_pulls < self.push_depth:
+            reachable = self.reach(agent, free, boxes)
+            candidates = self.pulls(free, boxes, reachable, last_pull)
+            if not candidates:
+                break
+            box, i = self.random.choice(candidates)
+            start = box + self.offsets[i]
+
+            boxes.remove(box)
+            boxes.add(start)
+            agent = start + self.offsets[i]
+            # Pulling the box back the other way would undo this pull
+            last_pull = (start, (i + 2) % 4)
+            num_pulls += 1
+
+        if boxes == goals:
+            return None
+
+        # The agent starts anywhere it can reach off the goals
+        reachable = self.reach(agent, free, boxes)
+        starts = sorted(cell for cell in reachable if cell not in goals)
+        if not starts:
+            return None
+        agent = self.random.choice(starts)
+
+        map_text = self.to_text(free, goals, boxes, agent)
+        solution = Search(map_text=map_text, visualize=False, verbose=False).search(Algorithms.AStar, push_level=True)
+        pushes = sum(move.isupper() for move in solution)
+        if pushes < self.min_pushes:
+            return None
+        return Level(map_text, solution, pushes, self.seed)
+
+    def to_text(self, free, goals, boxes, agent):
+        text = ""
+        for row in range(self.rows):
+            for col in range(self.cols):
+                cell = row * self.cols + col
+                if cell == agent:
+                    text += AGENT
+                elif cell in boxes:
+                    text += GOAL_FILLED if cell in goals else BOX
+                elif cell in goals:
+                    text += GOAL
+                else:
+                    text += PASSAGE if cell in free else WALL
+            text += '\n'
+        return text
+
+
+class LevelBatch:
+    """
+    Generates count levels with a pool of worker processes and writes them to a directory as
+    level_0000.txt, level_0001.txt, ... with a levels.jsonl index holding their solutions.
+
+    Level i is seeded with "seed/i", so a batch is reproducible and batches with different
+    seeds do not share levels.
+    """
+    def __init__(self, count, directory, seed=0, num_workers=None, rows=10, cols=10, num_boxes=2, push_depth=10,
+                 wall_density=0.1, min_pushes=0):
+        self.count = count
+        self.directory = directory
+        self.seed = seed
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.options = dict(rows=rows, cols=cols, num_boxes=num_boxes, push_depth=push_depth, wall_density=wall_density,
+                            min_pushes=min_pushes)
+
+    def level_path(self, i):
+        return os.path.join(self.directory, "level_%04d.txt" % i)
+
+    def run(self):
+        os.makedirs(self.directory, exist_ok=True)
+        context = multiprocessing.get_context('fork')
+        with context.Pool(self.num_workers) as pool, open(os.path.join(self.directory, "levels.jsonl"), 'w') as index:
+            for record in pool.imap(self.work, range(self.count)):
+                index.write(json.dumps(record) + "\n")
+
+    def work(self, i):
+        level = ReverseLevelGenerator(seed="%s/%d" % (self.seed, i), **self.options).generate()
+        with open(self.level_path(i), 'w') as map_file:
+            map_file.write(level.map_text)
+        record = asdict(level)
+        del record["map_text"]
+        return {"map": self.level_path(i), **record}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate levels that are solvable by construction.")
+    parser.add_argument("output", help="directory for the levels")
+    parser.add_argument("--count", type=int, default=100, help="number of levels")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the batch")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--rows", type=int, default=10)
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--boxes", type=int, default=2, help="number of boxes")
+    parser.add_argument("--push-depth", type=int, default=10, help="number of pulls away from the goals")
+    parser.add_argument("--min-pushes", type=int, default=0, help="fewest pushes of the optimal solution of a level")
+    parser.add_argument("--wall-density", type=float, default=0.1, help="chance of a wall on an inner cell")
+    args = parser.parse_args()
+
+    LevelBatch(args.count, args.output, args.seed, args.workers, args.rows, args.cols, args.boxes,
+               args.push_depth, args.wall_density, args.min_pushes).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+import json
+import mmap
+import os
+from array import array
+from defines import *
+
+# Standard XSB symbols and their letters in the project alphabet
+XSB2PROJECT = {'#': WALL, ' ': PASSAGE, '-': PASSAGE, '_': PASSAGE, '$': BOX, '.': GOAL, '*': GOAL_FILLED,
+               '@': AGENT, '+': AGENT_ON_GOAL}
+PROJECT2XSB = {WALL: '#', PASSAGE: ' ', BOX: '$', GOAL: '.', GOAL_FILLED: '*', AGENT: '@', AGENT_ON_GOAL: '+'}
+XSB_ONLY = set("#$*@+")
+BOARD_SYMBOLS = (WALL + PASSAGE + BOX + GOAL + GOAL_FILLED + AGENT + AGENT_ON_GOAL + "".join(XSB2PROJECT)).encode('ascii')
+# Separates the path of a pack from the number of a level in it, as in "levels.xsb#12"
+LEVEL_SEPARATOR = "#"
+
+
+class LevelPack:
+    """
+    Reads a file of many levels, in the project alphabet (X.JGFM) or in XSB (#.$*@+ and space).
+
+    A level is a block of board lines, any other line (blank, a "; comment" or a title) ends it
+    and the last such line before a level is kept as its title. The file is memory mapped and
+    levels are indexed by their byte offsets the first time they are passed, so level n is
+    reached by scanning lines up to it and only that level is parsed. Levels are returned as
+    map text in the project alphabet, ready for Search and Board.
+
+    Once the whole file is indexed the offsets are saved next to it in path.index, so later
+    readers (other processes included) seek straight to any level. The saved index is only
+    used while the size and modification time of the pack match it.
+    """
+    # Packs opened by read_level, reused by later lookups in this process and its forks
+    open_packs = {}
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        status = os.fstat(self.file.fileno())
+        self.version = [status.st_size, status.st_mtime_ns]
+        size = status.st_size
+        # An empty file can not be memory mapped
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.starts = array('q')
+        self.ends = array('q')
+        self.titles = []
+
+        # Scan state, so indexing resumes where it stopped
+        self.position = 0
+        self.level_start = None
+        self.level_end = None
+        self.title = None
+        self.scanned = False
+        self.load_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    @staticmethod
+    def index_path(path):
+        return path + ".index"
+
+    def load_index(self):
+        try:
+            with open(LevelPack.index_path(self.path), 'r') as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            return
+        if index.get("version") != self.version:
+            return
+        self.starts = array('q', index["starts"])
+        self.ends = array('q', index["ends"])
+        self.titles = index["titles"]
+        self.position = len(self.data)
+        self.scanned = True
+
+    def save_index(self):
+        # Best effort, a pack in a read only directory is simply scanned again next time
+        index = {"version": self.version, "starts": self.starts.tolist(), "ends": self.ends.tolist(),
+                 "titles": self.titles}
+        try:
+            with open(LevelPack.index_path(self.path), 'w') as index_file:
+                json.dump(index, index_file)
+        except OSError:
+            pass
+
+    def __len__(self):
+        for _ in self.scan():
+            pass
+        return len(self.starts)
+
+    def __iter__(self):
+        # Levels are yielded as soon as they are indexed
+        n = 0
+        while True:
+            if n >= len(self.starts) and next(self.scan(), None) is None:
+                return
+            yield self[n]
+            n += 1
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += len(self)
+        while n >= len(self.starts):
+            if next(self.scan(), None) is None:
+                raise IndexError("level " + str(n) + " is not in " + self.path)
+        return LevelPack.parse(self.data[self.starts[n]:self.ends[n]].decode('ascii'))
+
+    def levels(self, start=0):
+        # Levels from number start on, without parsing the ones before it
+        n = start
+        while True:
+            try:
+                yield self[n]
+            except IndexError:
+                return
+            n += 1
+
+    def scan(self):
+        # Indexes the levels after the last indexed one, yields the number of every new level
+        data = self.data
+        size = len(data)
+        while not self.scanned:
+            if self.position >= size:
+                self.scanned = True
+                n = self.add_level() if self.level_start is not None else None
+                self.save_index()
+                if n is not None:
+                    yield n
+                return
+
+            end = data.find(b"\n", self.position)
+            if end == -1:
+                end = size
+            line = data[self.position:end].rstrip(b"\r")
+            start = self.position
+            self.position = end + 1
+
+            if LevelPack.is_board_line(line):
+                if self.level_start is None:
+                    self.level_start = start
+                self.level_end = end
+                continue
+
+            # The state is updated before yielding, a caller may stop after any level
+            n = self.add_level() if self.level_start is not None else None
+            if line.strip():
+                self.title = line.decode('utf-8', errors='replace').strip().lstrip(';').strip()
+            if n is not None:
+                yield n
+
+    def add_level(self):
+        self.starts.append(self.level_start)
+        self.ends.append(self.level_end)
+        self.titles.append(self.title)
+        self.level_start = None
+        self.title = None
+        return len(self.starts) - 1
+
+    @staticmethod
+    def is_board_line(line):
+        # Only board symbols, with at least one wall
+        return bool(line) and not line.translate(None, BOARD_SYMBOLS) and (b"X" in line or b"#" in line)
+
+    @staticmethod
+    def parse(text):
+        rows = text.splitlines()
+        if any(XSB_ONLY.intersection(row) for row in rows):
+            rows = LevelPack.from_xsb(rows)
+        cols = max(len(row) for row in rows)
+        return "".join(row.ljust(cols, WALL) + "\n" for row in rows)
+
+    @staticmethod
+    def from_xsb(rows):
+        # XSB pads the outside of a level with spaces, so floor the agent can never reach becomes wall
+        rows = [[XSB2PROJECT[symbol] for symbol in row] for row in rows]
+        agent = next(((r, c) for r, row in enumerate(rows) for c, symbol in enumerate(row)
+                      if symbol in (AGENT, AGENT_ON_GOAL)), None)
+        reached = set()
+        frontier = [agent] if agent is not None else []
+        while frontier:
+            r, c = frontier.pop()
+            if (r, c) in reached or not 0 <= r < len(rows) or not 0 <= c < len(rows[r]) or rows[r][c] == WALL:
+                continue
+            reached.add((r, c))
+            frontier += [(r, c - 1), (r - 1, c), (r, c + 1), (r + 1, c)]
+        return ["".join(symbol if symbol != PASSAGE or (r, c) in reached else WALL for c, symbol in enumerate(row))
+                for r, row in enumerate(rows)]
+
+    @staticmethod
+    def is_pack(path):
+        return os.path.splitext(path)[1].lower() in LEVEL_PACK_EXTENSIONS
+
+    @staticmethod
+    def level_names(path):
+        # "path#n" for every level of a pack
+        return [path + LEVEL_SEPARATOR + str(n) for n in range(len(LevelPack.open_pack(path)))]
+
+    @staticmethod
+    def is_level_name(name):
+        path, separator, n = name.rpartition(LEVEL_SEPARATOR)
+        return bool(separator) and n.isdigit() and os.path.isfile(path)
+
+    @staticmethod
+    def open_pack(path):
+        # A pack stays open for later lookups until the file changes
+        pack = LevelPack.open_packs.get(path)
+        if pack is not None:
+            status = os.stat(path)
+            if pack.version == [status.st_size, status.st_mtime_ns]:
+                return pack
+            pack.close()
+        pack = LevelPack.open_packs[path] = LevelPack(path)
+        return pack
+
+    @staticmethod
+    def read_level(name):
+        # Map text of a level given as "path#n", or of a map file given by its path
+        if LevelPack.is_level_name(name):
+            path, _, n = name.rpartition(LEVEL_SEPARATOR)
+            return LevelPack.open_pack(path)[int(n)]
+        with open(name, 'r') as map_file:
+            return map_file.read()
+
+
+class LevelPackWriter:
+    """
+    Writes levels to a pack, separated by blank lines and each preceded by its title as a
+    "; title" comment. xsb writes the standard XSB symbols instead of the project alphabet.
+    """
+    def __init__(self, path, xsb=False):
+        self.file = open(path, 'w')
+        self.xsb = xsb
+        self.num_levels = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def write(self, map_text, title=None):
+        rows = [row for row in map_text.splitlines() if row]
+        if self.xsb:
+            rows = ["".join(PROJECT2XSB[symbol] for symbol in row) for row in rows]
+        if self.num_levels:
+            self.file.write("\n")
+        if title is not None:
+            self.file.write("; " + str(title) + "\n")
+        self.file.write("\n".join(rows) + "\n")
+        self.num_levels += 1
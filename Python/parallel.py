@@ -0,0 +1,225 @@
+import heapq
+import math
+import multiprocessing
+import queue
+from itertools import count
+
+# Messages sent to the workers
+NODES, PARENT, EXIT = 0, 1, 2
+# Messages sent back to the coordinator
+GOAL, PARENT_FOUND, STATS = 0, 1, 2
+
+
+class ParallelSearch:
+    """
+    Hash distributed A* (HDA*) over the move generation of a Search.
+
+    Every state is owned by the worker given by its Zobrist key modulo the number of workers.
+    A worker expands the nodes of its own open list and sends every child to the owner of
+    that child, in batches over one multiprocessing queue per worker. Each worker keeps the
+    best g and the parent of the states it owns, so the path is rebuilt by asking the owners
+    for parents once a goal is found.
+
+    A popped goal is not expanded but becomes the incumbent when its g is not above the best
+    one so far, and nodes with f above the incumbent are no longer expanded. The search stops
+    when every worker is idle (has no open node with f up to the incumbent), no batch is in
+    flight and every goal found has reached the coordinator, all checked under a single lock.
+    The solution is then optimal for an admissible heuristic. Nodes with f equal to the
+    incumbent are still expanded, and ties are broken by the smallest goal state and the
+    smallest parent state with the best g, so the solution does not depend on the timing of
+    the workers.
+    Workers are forked, so the Search and its tables are shared without pickling.
+    """
+    def __init__(self, search, num_workers=None, batch_size=64):
+        self.search = search
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+
+    def owner(self, key):
+        return key % self.num_workers
+
+    def run(self, state, key, cost):
+        context = multiprocessing.get_context('fork')
+        self.queues = [context.Queue() for _ in range(self.num_workers)]
+        self.results = context.Queue()
+        self.lock = context.Lock()
+        self.in_flight = context.Value('q', 0, lock=False)
+        self.idle = context.Array('b', [1] * self.num_workers, lock=False)
+        # g of the best goal found so far and the number of goals sent to the coordinator
+        self.incumbent = context.Value('d', math.inf, lock=False)
+        self.num_goals = context.Value('q', 0, lock=False)
+        self.stop = context.Event()
+        self.stats = {}
+
+        self.send(self.owner(key), [(cost, 0, state, key, None, None)])
+        self.workers = [context.Process(target=self.work, args=(worker_id,), daemon=True)
+                        for worker_id in range(self.num_workers)]
+        for worker in self.workers:
+            worker.start()
+
+        goal = self.wait_for_goal()
+        self.stop.set()
+
+        visited_states = None
+        if goal is not None:
+            visited_states = []
+            state, key = goal
+            while state is not None:
+                visited_states.append(state)
+                self.queues[self.owner(key)].put((PARENT, state))
+                state, key = self.receive(PARENT_FOUND)[1]
+            visited_states.reverse()
+
+        for inbox in self.queues:
+            inbox.put((EXIT,))
+        while len(self.stats) < self.num_workers:
+            self.receive(STATS)
+        for worker in self.workers:
+            worker.join()
+
+        for counts in self.stats.values():
+            self.search.stats.merge(counts)
+        return visited_states
+
+    def send(self, worker_id, batch):
+        # Batches are counted before they are queued, so the termination check never misses one
+        with self.lock:
+            self.in_flight.value += len(batch)
+        self.queues[worker_id].put((NODES, batch))
+
+    def receive(self, kind):
+        while True:
+            message = self.results.get()
+            if message[0] == STATS:
+                self.stats[message[1]] = message[2]
+                if kind == STATS:
+                    return message
+            elif message[0] == kind:
+                return message
+
+    def is_finished(self, num_goals):
+        with self.lock:
+            return self.in_flight.value == 0 and all(self.idle) and self.num_goals.value == num_goals
+
+    def wait_for_goal(self):
+        # (g, state, key) of the best goal received
+        best = None
+        num_goals = 0
+        while True:
+            try:
+                message = self.results.get(timeout=0.05)
+            except queue.Empty:
+                if self.is_finished(num_goals):
+                    return best[1:] if best is not None else None
+                if not all(worker.is_alive() for worker in self.workers):
+                    for worker in self.workers:
+                        worker.terminate()
+                    raise RuntimeError("A search worker exited before the search finished.")
+                continue
+            if message[0] == GOAL:
+                num_goals += 1
+                if best is None or message[1:3] < best[:2]:
+                    best = message[1:]
+
+    def work(self, worker_id):
+        search = self.search
+        inbox = self.queues[worker_id]
+        open_list = []
+        best_g = {}
+        parents = {}
+        insertion_order = count()
+        buffers = [[] for _ in range(self.num_workers)]
+        pending = None
+        # Each worker counts into its own copy of the stats, the coordinator adds them up
+        search.stats.reset()
+
+        def insert(entry):
+            cost, g, state, key, parent_state, parent_key = entry
+            if state in best_g and best_g[state] <= g:
+                search.stats.num_duplicates += 1
+                # Of the parents with the best g the smallest is kept, whichever arrives first
+                if best_g[state] == g and parent_state is not None and parent_state < parents[state][0]:
+                    parents[state] = (parent_state, parent_key)
+                return
+            best_g[state] = g
+            parents[state] = (parent_state, parent_key)
+            heapq.heappush(open_list, (cost, next(insertion_order), g, state, key))
+
+        def has_work():
+            # Nodes with f above the incumbent can not lead to a better solution
+            return open_list and open_list[0][0] <= self.incumbent.value
+
+        while not self.stop.is_set():
+            if has_work():
+                try:
+                    message = inbox.get_nowait()
+                except queue.Empty:
+                    message = None
+            else:
+                # Everything this worker generated is sent before it reports itself idle
+                for owner, batch in enumerate(buffers):
+                    if batch:
+                        self.send(owner, batch)
+                        buffers[owner] = []
+                with self.lock:
+                    self.idle[worker_id] = 1
+                try:
+                    message = inbox.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+
+            # Lookups and exit requests only arrive once the search is stopped
+            if message is not None and message[0] != NODES:
+                pending = message
+                break
+
+            if message is not None:
+                batch = message[1]
+                with self.lock:
+                    self.idle[worker_id] = 0
+                    self.in_flight.value -= len(batch)
+                for entry in batch:
+                    insert(entry)
+
+            if not has_work():
+                continue
+
+            cost, _, g, state, key = heapq.heappop(open_list)
+            # Entries superseded by a cheaper path are skipped lazily
+            if best_g[state] < g:
+                search.stats.num_duplicates += 1
+                continue
+
+            search.stats.expanded(len(open_list), g)
+            if search.decode_state(state)[0] == search.goal_state:
+                with self.lock:
+                    if g > self.incumbent.value:
+                        continue
+                    self.incumbent.value = g
+                    self.num_goals.value += 1
+                self.results.put((GOAL, g, state, key))
+                continue
+
+            for child_state, child_key, child_cost in search.expand(state, g, key, with_cost=True):
+                entry = (child_cost, g + 1, child_state, child_key, state, key)
+                owner = self.owner(child_key)
+                if owner == worker_id:
+                    insert(entry)
+                    continue
+                buffers[owner].append(entry)
+                if len(buffers[owner]) >= self.batch_size:
+                    self.send(owner, buffers[owner])
+                    buffers[owner] = []
+
+        # Answer parent lookups for the path reconstruction until the coordinator is done
+        self.results.put((STATS, worker_id, search.stats.as_dict()))
+        while True:
+            message = pending if pending is not None else inbox.get()
+            pending = None
+            if message[0] == PARENT:
+                self.results.put((PARENT_FOUND, parents[message[1]]))
+            elif message[0] == EXIT:
+                break
+        # Batches still queued for other workers will never be read, do not wait for them on exit
+        for other_inbox in self.queues:
+            other_inbox.cancel_join_thread()
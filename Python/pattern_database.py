@@ -0,0 +1,101 @@
+import argparse
+import os
+from itertools import combinations
+import numpy as np
+from defines import *
+from heuristics import PatternDatabaseHeuristic, PATTERN_UNREACHABLE
+from level_pack import LevelPack
+from SokobanSearch import Search
+from utilities import BoxCombinatorics
+
+
+class PatternDatabaseBuilder:
+    """
+    Offline builder of the pattern databases of one map.
+
+    For every group size up to max_size a backward BFS pulls groups of that many boxes away
+    from every combination of goals, with the other boxes removed. States are box layouts
+    (ranked as in BoxCombinatorics) with a canonical agent position, and the table keeps the
+    smallest number of pulls over all agent positions for each box layout.
+    """
+    def __init__(self, map_text):
+        self.map_text = map_text
+        self.search = Search(map_text=map_text, visualize=False, verbose=False)
+        self.goal_indices = self.search.boxes_combinatorics.unrank(self.search.goal_state)
+
+    def build(self, max_size, directory):
+        os.makedirs(directory, exist_ok=True)
+        for size in range(1, min(max_size, self.search.num_boxes) + 1):
+            np.save(PatternDatabaseHeuristic.table_path(directory, self.map_text, size), self.build_table(size))
+
+    def agent_regions(self, boxes):
+        # One canonical agent position per region of free spaces
+        regions = set()
+        seen = set()
+        for index in range(1, self.search.num_spaces + 1):
+            if index in boxes or index in seen:
+                continue
+            reachable = self.search.reachable_indices(index, boxes)
+            seen |= reachable
+            regions.add(min(reachable))
+        return regions
+
+    def build_table(self, size):
+        search = self.search
+        neighbours = search.neighbours
+        combinatorics = BoxCombinatorics(search.num_spaces, size)
+        table = np.full(combinatorics.num_states, PATTERN_UNREACHABLE, dtype=np.uint8)
+
+        frontier = []
+        for goals in combinations(self.goal_indices, size):
+            rank = combinatorics.indices2state(goals)
+            table[rank - 1] = 0
+            frontier += [(rank, agent) for agent in self.agent_regions(set(goals))]
+        visited = set(frontier)
+
+        depth = 0
+        while frontier:
+            depth += 1
+            next_frontier = []
+            for rank, agent in frontier:
+                boxes_indices = combinatorics.unrank(rank)
+                boxes = set(boxes_indices)
+                reachable = search.reachable_indices(agent, boxes)
+                for box_index in boxes_indices:
+                    for i, new_box_index in enumerate(neighbours[box_index]):
+                        # The agent stands on new_box_index and pulls the box while stepping away
+                        if new_box_index is None or new_box_index not in reachable:
+                            continue
+                        new_agent_index = neighbours[new_box_index][i]
+                        if new_agent_index is None or new_agent_index in boxes:
+                            continue
+                        new_boxes_indices = [new_box_index if index == box_index else index for index in boxes_indices]
+                        new_rank = combinatorics.indices2state(new_boxes_indices)
+                        new_agent = search.normalize_agent(new_agent_index, set(new_boxes_indices))
+                        if (new_rank, new_agent) in visited:
+                            continue
+                        visited.add((new_rank, new_agent))
+                        next_frontier.append((new_rank, new_agent))
+                        if table[new_rank - 1] == PATTERN_UNREACHABLE:
+                            table[new_rank - 1] = min(depth, PATTERN_UNREACHABLE - 1)
+            frontier = next_frontier
+        return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the pattern databases of Sokoban maps.")
+    parser.add_argument("maps", nargs="+", help="map files, level packs or path#n for level n of a pack")
+    parser.add_argument("--size", type=int, default=2, help="largest group of boxes in a pattern")
+    parser.add_argument("--output", default=PATTERN_DATABASE_DIRECTORY, help="directory for the tables")
+    args = parser.parse_args()
+
+    names = []
+    for name in args.maps:
+        names += LevelPack.level_names(name) if LevelPack.is_pack(name) else [name]
+    for name in names:
+        PatternDatabaseBuilder(LevelPack.read_level(name)).build(args.size, args.output)
+        print("Built", name)
+
+
+if __name__ == "__main__":
+    main()
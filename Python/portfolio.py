@@ -0,0 +1,131 @@
+import json
+import multiprocessing
+import queue
+import time
+from dataclasses import dataclass, asdict
+from SokobanSearch import Search, Algorithms
+
+
+@dataclass
+class Configuration:
+    algorithm: Algorithms
+    push_level: bool = False
+    heuristic_weight: float = 1
+
+
+@dataclass
+class ConfigurationStats:
+    configuration: Configuration
+    status: str
+    moves: int = None
+    pushes: int = None
+    expanded: int = 0
+    time: float = 0
+
+
+# Parallel A* is left out, its workers can not be started from a portfolio worker
+DEFAULT_PORTFOLIO = [
+    Configuration(Algorithms.AStar, push_level=True),
+    Configuration(Algorithms.AStar, push_level=True, heuristic_weight=3),
+    Configuration(Algorithms.Bidirectional, push_level=True),
+    Configuration(Algorithms.AStar),
+    Configuration(Algorithms.BFS, push_level=True),
+    Configuration(Algorithms.DFS, push_level=True),
+]
+
+
+class Portfolio:
+    """
+    Races several search configurations on one map, each in its own process.
+
+    With first_solution the first configuration to solve the map wins and the others are
+    cancelled. Otherwise every configuration runs until the time budget (in seconds) is spent
+    and the solution with the fewest moves, then pushes, wins. At most num_workers
+    configurations run at once, the rest start as workers finish.
+    """
+    def __init__(self, map_file_path, configurations=None, num_workers=None, time_budget=None,
+                 first_solution=True, stats_path=None, pattern_database_directory=None):
+        self.map_file_path = map_file_path
+        self.configurations = configurations or DEFAULT_PORTFOLIO
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.time_budget = time_budget
+        self.first_solution = first_solution
+        self.stats_path = stats_path
+        self.pattern_database_directory = pattern_database_directory
+        self.stats = []
+        self.winner = None
+
+    def solve(self):
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        waiting = list(enumerate(self.configurations))
+        running = {}
+        stats = [ConfigurationStats(configuration, "skipped") for configuration in self.configurations]
+        solutions = {}
+        start_time = time.time()
+
+        while waiting or running:
+            if self.first_solution and solutions:
+                break
+            if self.time_budget is not None and time.time() - start_time > self.time_budget:
+                break
+
+            while waiting and len(running) < self.num_workers:
+                i, configuration = waiting.pop(0)
+                process = context.Process(target=self.work, args=(i, configuration, results), daemon=True)
+                process.start()
+                running[i] = (process, time.time())
+
+            try:
+                i, solution, expanded, elapsed = results.get(timeout=0.05)
+            except queue.Empty:
+                # A worker that died without reporting back, e.g. out of memory
+                for i, (process, started) in list(running.items()):
+                    if not process.is_alive() and process.exitcode != 0:
+                        stats[i].status = "failed"
+                        stats[i].time = time.time() - started
+                        del running[i]
+                continue
+
+            running.pop(i)[0].join()
+            stats[i].expanded = expanded
+            stats[i].time = elapsed
+            if solution is None:
+                stats[i].status = "unsolved"
+                continue
+            stats[i].status = "solved"
+            stats[i].moves = len(solution)
+            stats[i].pushes = sum(move.isupper() for move in solution)
+            solutions[i] = solution
+
+        status = "cancelled" if solutions else "timeout"
+        for i, (process, started) in running.items():
+            process.terminate()
+            process.join()
+            stats[i].status = status
+            stats[i].time = time.time() - started
+
+        self.stats = stats
+        solution = None
+        if solutions:
+            self.winner = min(solutions, key=lambda i: (stats[i].moves, stats[i].pushes))
+            solution = solutions[self.winner]
+        if self.stats_path is not None:
+            self.save_stats()
+        return solution
+
+    def work(self, i, configuration, results):
+        start_time = time.time()
+        search = Search(self.map_file_path, heuristic_weight=configuration.heuristic_weight, visualize=False, verbose=False,
+                        pattern_database_directory=self.pattern_database_directory)
+        solution = search.search(configuration.algorithm, push_level=configuration.push_level)
+        results.put((i, solution, search.num_expanded, time.time() - start_time))
+
+    def save_stats(self):
+        with open(self.stats_path, 'a') as file:
+            for i, stats in enumerate(self.stats):
+                record = asdict(stats)
+                record["configuration"]["algorithm"] = stats.configuration.algorithm.value
+                record["map"] = self.map_file_path
+                record["winner"] = i == self.winner
+                file.write(json.dumps(record) + "\n")
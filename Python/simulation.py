@@ -7,28 +7,31 @@ from utilities import Utilities as utils
 
 
 class Simulation:
-    def __init__(self, env, agent_pos: Pos, solution: str):
+    def __init__(self, env, agent_cell: int, solution: str):
         self.env = env
         self.init_env = env
         self.rows, self.cols = env.shape
-        self.agent_pos = agent_pos
-        self.init_agent_pos = agent_pos
+        # The agent is tracked as a grid cell row * cols + col
+        self.agent_cell = agent_cell
+        self.init_agent_cell = agent_cell
         self.solution = solution
 
-        self.move2dir, self.dir2move = utils.create_move_and_dir_dictionaries()
+        _, self.dir2offset = utils.create_direction_tables(self.cols)
         self.display = Display((self.cols, self.rows))
-        self.display.update(self.env, self.agent_pos)
+        self.display.update(self.env, Pos.from_cell(self.agent_cell, self.cols))
 
-    def set_environment(self, move: Pos):
-        self.agent_pos += move
+    def set_environment(self, offset: int):
+        self.agent_cell += offset
+        # A flat view of the grid, so cells are indexed directly
+        cells = self.env.reshape(-1)
 
-        if self.env[self.agent_pos.y][self.agent_pos.x] == BOX or self.env[self.agent_pos.y][self.agent_pos.x] == GOAL_FILLED:
-            self.env[self.agent_pos.y][self.agent_pos.x] = GOAL if self.env[self.agent_pos.y][self.agent_pos.x] == GOAL_FILLED else PASSAGE
+        if cells[self.agent_cell] == BOX or cells[self.agent_cell] == GOAL_FILLED:
+            cells[self.agent_cell] = GOAL if cells[self.agent_cell] == GOAL_FILLED else PASSAGE
 
-            if self.env[self.agent_pos.y + move.y][self.agent_pos.x + move.x] == GOAL:
-                self.env[self.agent_pos.y + move.y][self.agent_pos.x + move.x] = GOAL_FILLED
+            if cells[self.agent_cell + offset] == GOAL:
+                cells[self.agent_cell + offset] = GOAL_FILLED
             else:
-                self.env[self.agent_pos.y + move.y][self.agent_pos.x + move.x] = BOX
+                cells[self.agent_cell + offset] = BOX
 
     def run(self):
         is_running = True
@@ -40,12 +43,11 @@ class Simulation:
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_SPACE:
                         self.env = deepcopy(self.init_env)
-                        self.agent_pos = self.init_agent_pos
-                        self.display.update(self.env,self.agent_pos)
+                        self.agent_cell = self.init_agent_cell
+                        self.display.update(self.env, Pos.from_cell(self.agent_cell, self.cols))
                         for c in self.solution:
-                            move = self.dir2move[c]
-                            self.set_environment(move)
-                            self.display.update(self.env, self.agent_pos)
+                            self.set_environment(self.dir2offset[c])
+                            self.display.update(self.env, Pos.from_cell(self.agent_cell, self.cols))
                             pygame.time.Clock().tick(15)
 
 
@@ -81,7 +83,7 @@ class Display:
                     pygame.draw.rect(self.display, ORANGE, [col * self.tile_size + self.tile_size * 0.1,
                                                             row * self.tile_size + self.tile_size * 0.1,
                                                             self.tile_size * 0.8, self.tile_size * 0.8])
-                elif el == GOAL:
+                elif el == GOAL or el == AGENT_ON_GOAL:
                     pygame.draw.rect(self.display, RED, [col * self.tile_size + self.tile_size * 0.1,
                                                          row * self.tile_size + self.tile_size * 0.1,
                                                          self.tile_size * 0.8, self.tile_size * 0.8])
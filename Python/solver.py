@@ -0,0 +1,156 @@
+import multiprocessing
+import os
+import resource
+import signal
+import sys
+import time
+from dataclasses import dataclass
+from defines import *
+from SokobanSearch import Search, Algorithms
+
+# Seconds a stopped search gets to send back its partial stats before it is killed
+STOP_GRACE = 1.0
+
+
+class SearchInterrupted(Exception):
+    pass
+
+
+@dataclass
+class Limits:
+    time: float = None  # seconds
+    memory: int = None  # bytes of address space
+    transposition: int = TRANSPOSITION_BUDGET  # bytes of the table closing states, BFS and DFS stop with "memory" over it
+
+
+@dataclass
+class Result:
+    status: str  # solved, unsolved, timeout, memory or failed
+    solution: str = None
+    moves: int = None
+    pushes: int = None
+    expanded: int = 0
+    time: float = 0
+    peak_rss: int = None  # bytes, peak of the process the search ran in
+    stats: dict = None  # SearchStats.as_dict() of the search
+    cached: bool = False  # read from a SolutionCache, expanded and stats are from the stored search
+
+
+def solve(map_text, algorithm=Algorithms.AStar, limits=None, push_level=False, cache=None,
+          pattern_database_directory=None, stats=None):
+    """
+    Solves the map given as text without printing or visualizing, pygame is never imported.
+
+    Without time or memory limits the search runs in this process. Otherwise it runs in a
+    forked process that is stopped once the time limit is spent, and sends back the stats it
+    gathered until then.
+    With a SolutionCache a cached map is answered without building any search tables, and
+    finished searches (solved or proven unsolvable) are stored.
+    With a pattern_database_directory the tables built there for the map by pattern_database.py
+    replace the matching heuristic, maps without tables are searched as before.
+    A SearchStats given as stats collects the counters, its callback reports progress from the
+    process the search runs in.
+    """
+    limits = limits or Limits()
+    algorithm = Algorithms(algorithm)
+    if cache is not None:
+        start_time = time.time()
+        configuration = algorithm.value + (":pushes" if push_level else ":moves")
+        # Pattern databases change the expansions and may change the solution of weighted searches
+        if pattern_database_directory is not None:
+            configuration += ":patterns"
+        cached = cache.get(map_text, configuration)
+        if cached is not None:
+            solution, stats = cached
+            return Result("unsolved" if solution is None else "solved", solution,
+                          None if solution is None else len(solution),
+                          None if solution is None else sum(move.isupper() for move in solution),
+                          stats["expanded"], time.time() - start_time, stats=stats, cached=True)
+
+        result = solve(map_text, algorithm, limits, push_level, pattern_database_directory=pattern_database_directory,
+                       stats=stats)
+        if result.status in ("solved", "unsolved"):
+            cache.put(map_text, configuration, result.solution, result.stats)
+        return result
+
+    if limits.time is None and limits.memory is None:
+        return run_search(map_text, algorithm, limits, push_level, pattern_database_directory, stats)
+
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    # Not a daemon, so Parallel A* can start its own workers
+    process = context.Process(target=run_limited_search,
+                              args=(sender, map_text, algorithm, limits, push_level, pattern_database_directory, stats))
+    start_time = time.time()
+    process.start()
+    sender.close()
+
+    result = None
+    try:
+        if receiver.poll(limits.time):
+            try:
+                result = receiver.recv()
+            except EOFError:
+                # The process died without a result, e.g. killed for memory
+                result = Result("failed")
+        else:
+            # A stopped search answers with a timeout result holding its partial stats
+            process.terminate()
+            if receiver.poll(STOP_GRACE):
+                try:
+                    result = receiver.recv()
+                except EOFError:
+                    pass
+            if result is None:
+                result = Result("timeout")
+    finally:
+        process.join(STOP_GRACE)
+        if process.is_alive():
+            process.kill()
+            process.join()
+    if result.status in ("timeout", "failed"):
+        result.time = time.time() - start_time
+    return result
+
+
+def run_search(map_text, algorithm, limits, push_level, pattern_database_directory=None, stats=None):
+    start_time = time.time()
+    search = None
+    try:
+        search = Search(map_text=map_text, transposition_budget=limits.transposition, visualize=False, verbose=False,
+                        stats=stats, pattern_database_directory=pattern_database_directory)
+        solution = search.search(algorithm, push_level=push_level)
+    except (MemoryError, SearchInterrupted) as error:
+        # Out of address space or over the transposition budget, or stopped at the time limit
+        status = "timeout" if isinstance(error, SearchInterrupted) else "memory"
+        if search is None:
+            return Result(status, time=time.time() - start_time)
+        return Result(status, expanded=search.num_expanded, time=time.time() - start_time,
+                      peak_rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, stats=search.stats.as_dict())
+
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    if solution is None:
+        return Result("unsolved", expanded=search.num_expanded, time=time.time() - start_time, peak_rss=peak_rss,
+                      stats=search.stats.as_dict())
+    return Result("solved", solution, len(solution), sum(move.isupper() for move in solution),
+                  search.num_expanded, time.time() - start_time, peak_rss, search.stats.as_dict())
+
+
+def run_limited_search(sender, map_text, algorithm, limits, push_level, pattern_database_directory=None, stats=None):
+    search_pid = os.getpid()
+
+    def interrupt(signum, frame):
+        # Parallel A* workers inherit the handler and just exit
+        if os.getpid() != search_pid:
+            sys.exit(1)
+        # Only the first terminate interrupts the search, the partial result is sent undisturbed
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        raise SearchInterrupted()
+
+    # Returning normally after terminate lets multiprocessing stop the Parallel A* workers as well
+    signal.signal(signal.SIGTERM, interrupt)
+    if limits.memory is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (limits.memory, limits.memory))
+    sender.send(run_search(map_text, algorithm, limits, push_level, pattern_database_directory, stats))
+    sender.close()
@@ -0,0 +1,78 @@
+import time
+
+PHASES = ("setup", "expansion", "heuristic", "reconstruction")
+# unreachable: the heuristic found no assignment of the boxes to the goals
+PRUNE_TYPES = ("dead_square", "block", "freeze", "unreachable")
+
+
+class SearchStats:
+    """
+    Counters and phase timings of a search.
+
+    Every sample_interval expansions the frontier size and the depth of the expanded node are
+    sampled. If a callback is given it is called with the stats on every sample, or at most
+    once every report_interval seconds when that is set.
+    """
+    def __init__(self, sample_interval=1000, callback=None, report_interval=None):
+        self.sample_interval = sample_interval
+        self.callback = callback
+        self.report_interval = report_interval
+        self.phase_times = dict.fromkeys(PHASES, 0.0)
+        self.reset()
+
+    def reset(self):
+        # Setup is done once per Search and survives the reset before every search
+        setup_time = self.phase_times["setup"]
+        self.num_expanded = 0
+        self.num_generated = 0
+        self.num_duplicates = 0
+        # Bytes of the search nodes (NodeArena.nbytes) when the search ended
+        self.arena_bytes = 0
+        self.prunes = dict.fromkeys(PRUNE_TYPES, 0)
+        self.phase_times = dict.fromkeys(PHASES, 0.0)
+        self.phase_times["setup"] = setup_time
+        # (seconds since the reset, expanded nodes, frontier size, depth)
+        self.samples = []
+        self.start_time = time.time()
+        self.last_report = self.start_time
+
+    def expanded(self, frontier_size, depth):
+        self.num_expanded += 1
+        if self.num_expanded % self.sample_interval == 0:
+            self.sample(frontier_size, depth)
+
+    def sample(self, frontier_size, depth):
+        now = time.time()
+        self.samples.append((now - self.start_time, self.num_expanded, frontier_size, depth))
+        if self.callback is None:
+            return
+        if self.report_interval is None or now - self.last_report >= self.report_interval:
+            self.last_report = now
+            self.callback(self)
+
+    def as_dict(self):
+        return {"expanded": self.num_expanded, "generated": self.num_generated, "duplicates": self.num_duplicates,
+                "arena_bytes": self.arena_bytes, "prunes": dict(self.prunes), "phase_times": dict(self.phase_times), "samples": list(self.samples)}
+
+    def merge(self, counts):
+        # Adds the counters and phase times of an as_dict() from another process, e.g. a Parallel A* worker
+        self.num_expanded += counts["expanded"]
+        self.num_generated += counts["generated"]
+        self.num_duplicates += counts["duplicates"]
+        self.arena_bytes += counts["arena_bytes"]
+        for prune_type, num_prunes in counts["prunes"].items():
+            self.prunes[prune_type] += num_prunes
+        for phase in ("expansion", "heuristic", "reconstruction"):
+            self.phase_times[phase] += counts["phase_times"][phase]
+
+    @staticmethod
+    def format_report(stats):
+        frontier_size, depth = stats.samples[-1][2:] if stats.samples else (0, 0)
+        return "[{:.1f}s] expanded {} generated {} duplicates {} frontier {} depth {}".format(
+            time.time() - stats.start_time, stats.num_expanded, stats.num_generated, stats.num_duplicates,
+            frontier_size, depth)
+
+    @staticmethod
+    def print_report(stats):
+        # Ready made callback for periodic progress reports
+        print(SearchStats.format_report(stats))
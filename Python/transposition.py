@@ -0,0 +1,82 @@
+import random
+
+# Rough size of one entry in bytes (dict slot, 64 bit key, g and its bucket reference)
+ENTRY_SIZE = 128
+
+
+class ZobristHasher:
+    """
+    64 bit Zobrist keys for a state: the xor of one random key per box space and one for the
+    agent space. A move or push only changes a few keys, so children are hashed incrementally.
+    """
+    def __init__(self, num_spaces, seed=0):
+        rng = random.Random(seed)
+        self.box_keys = [rng.getrandbits(64) for _ in range(num_spaces + 1)]
+        self.agent_keys = [rng.getrandbits(64) for _ in range(num_spaces + 1)]
+
+    def hash(self, boxes_indices, agent_index):
+        key = self.agent_keys[agent_index]
+        for index in boxes_indices:
+            key ^= self.box_keys[index]
+        return key
+
+    def move_agent(self, key, agent_index, new_agent_index):
+        return key ^ self.agent_keys[agent_index] ^ self.agent_keys[new_agent_index]
+
+    def move_box(self, key, box_index, new_box_index):
+        return key ^ self.box_keys[box_index] ^ self.box_keys[new_box_index]
+
+
+class BudgetExceeded(MemoryError):
+    pass
+
+
+class TranspositionTable:
+    """
+    Best g seen per Zobrist key, bounded by a memory budget in bytes.
+
+    When the table is full the entry with the highest g is evicted, so shallow entries
+    (the ones that prune the most) are kept. A new entry deeper than everything in a
+    full table is not stored. A table that must not lose entries (evict False, for searches
+    that close states through it) raises BudgetExceeded instead once it is full.
+    """
+    def __init__(self, memory_budget, evict=True):
+        self.max_entries = max(1, memory_budget // ENTRY_SIZE)
+        self.can_evict = evict
+        self.entries = {}
+        # g -> keys stored with that g, may hold stale keys that were improved or evicted
+        self.buckets = {}
+        self.max_g = 0
+        self.num_evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, g):
+        if key not in self.entries and len(self.entries) >= self.max_entries:
+            if not self.can_evict:
+                raise BudgetExceeded("transposition table is over its budget of "
+                                     + str(self.max_entries * ENTRY_SIZE) + " bytes")
+            if not self.evict(g):
+                return False
+
+        self.entries[key] = g
+        self.buckets.setdefault(g, []).append(key)
+        self.max_g = max(self.max_g, g)
+        return True
+
+    def evict(self, g):
+        while self.max_g > g:
+            bucket = self.buckets.get(self.max_g)
+            while bucket:
+                key = bucket.pop()
+                if self.entries.get(key) == self.max_g:
+                    del self.entries[key]
+                    self.num_evictions += 1
+                    return True
+            self.buckets.pop(self.max_g, None)
+            self.max_g -= 1
+        return False
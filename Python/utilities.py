@@ -1,116 +1,90 @@
-import sys
 import math
+import numpy as np
 from dataclasses import dataclass
 from defines import *
 
-COLS = 0
-ROWS = 0
-
-@dataclass
+@dataclass(frozen=True)
 class Pos:
+    """
+    (x, y) coordinates, only used at the edges to draw. The search works on integer space
+    indices and the grid on integer cells row * cols + col, from_cell converts a cell for the
+    display.
+    """
     x: int
     y: int
 
-    def __str__(self):
-        return Utilities.double_digit_stringify_int(self.x) + Utilities.double_digit_stringify_int(self.y)
-
-    def __hash__(self):
-        return hash(str(self))
-
-    def __eq__(self, other):
-        return self.x == other.x and self.y == other.y
-
     def __add__(self, other):
         return Pos(self.x + other.x, self.y + other.y)
 
     def __sub__(self, other):
         return Pos(self.x - other.x, self.y - other.y)
 
-    def __lt__(self, other):
-        return (self.y * COLS + self.x) < (other.y * COLS + other.x)
-
-    def __gt__(self, other):
-        return (self.y * COLS + self.x) > (other.y * COLS + other.x)
-
-class Utilities:
-    @staticmethod
-    def double_digit_stringify_int(num):
-        return '0' + str(num) if num < 10 else str(num)
-
     @staticmethod
-    def get_sorted_indeces(indeces):
-        box_indeces = [int(indeces[i:i + 2]) for i in range(0, len(indeces), 2)]
-        box_indeces.sort()
-        mapped = map(Utilities.double_digit_stringify_int, box_indeces)
-        return "".join(mapped)
+    def from_cell(cell, cols):
+        y, x = divmod(cell, cols)
+        return Pos(x, y)
 
+class Utilities:
     @staticmethod
-    def create_move_and_dir_dictionaries():
-        move2dir = {
-            Pos(-1, 0): 'L',
-            Pos(0, -1): 'U',
-            Pos(1, 0): 'R',
-            Pos(0, 1): 'D',
-        }
-        dir2move = {
-            'L': Pos(-1, 0),
-            'U': Pos(0, -1),
-            'R': Pos(1, 0),
-            'D': Pos(0, 1),
-            'l': Pos(-1, 0),
-            'u': Pos(0, -1),
-            'r': Pos(1, 0),
-            'd': Pos(0, 1),
-        }
-        return move2dir, dir2move
+    def create_direction_tables(cols):
+        # Cell offsets of the actions (LEFT, UP, RIGHT, DOWN) on a grid with cols columns,
+        # and the offset of every move letter, pushes in upper case and walks in lower case
+        offsets = (-1, -cols, 1, cols)
+        dir2offset = {}
+        for letter, offset in zip(MOVE_LETTERS, offsets):
+            dir2offset[letter] = offset
+            dir2offset[letter.lower()] = offset
+        return offsets, dir2offset
 
     @staticmethod
     def create_space_and_index_conversion_dictionaries(rows, cols, environment):
-        value = 0
-        pos2index = {}
-        global COLS, ROWS
-        COLS = cols
-        ROWS = rows
-        for row in range(rows):
-            for col in range(cols):
-                if environment[row][col] != WALL:
-                    key = Pos(col, row)
-                    value += 1
-                    pos2index[key] = value
+        # np.nonzero walks the spaces in row major order, so indices match Board.index_map
+        space_rows, space_cols = np.nonzero(np.asarray(environment) != WALL)
+        pos2index = {Pos(col, row): value for value, (row, col) in enumerate(zip(space_rows.tolist(), space_cols.tolist()), 1)}
 
         index2pos = {v: k for k, v in pos2index.items()}
         return pos2index, index2pos
 
-    @staticmethod
-    def combinations(n, k, min_n=0, accumulator=None):
-        if accumulator is None:
-            accumulator = []
-        if k == 0:
-            return [accumulator]
-        else:
-            return [l for x in range(min_n, n)
-                    for l in Utilities.combinations(n, k - 1, x + 1, accumulator + [x + 1])]
-
-    @staticmethod
-    def create_boxes_combinatorics_conversion_dictionaries(num_spaces, num_boxes, index2pos, corners):
-        boxes_index2states = {}
-        value = 0
-        combinations = Utilities.combinations(num_spaces, num_boxes)
-        for combi in combinations:
-            is_deadlock = False
-            key = ()
-            for index in combi:
-                pos = index2pos[index]
-                key += pos,
-            key = tuple(sorted(key))
-            value += 1
-            for corner in corners:
-                for k in key:
-                    if corner == k:
-                        is_deadlock = True
-            dict_value = -1 * value if is_deadlock else value
-            boxes_index2states[key] = dict_value
-        boxes_states2index = {v: k for k, v in boxes_index2states.items()}
-        return boxes_index2states, boxes_states2index
-
 
+class BoxCombinatorics:
+    """
+    Ranks and unranks box layouts with the combinatorial number system.
+
+    A layout is a set of num_boxes distinct space indices c_1 < ... < c_k and its
+    state is 1 + sum(C(c_i - 1, i)), so states run from 1 to C(num_spaces, num_boxes)
+    and are computed on demand instead of being enumerated up front.
+    """
+    def __init__(self, num_spaces, num_boxes):
+        self.num_spaces = num_spaces
+        self.num_boxes = num_boxes
+        self.num_states = math.comb(num_spaces, num_boxes)
+
+        # binomials[n][k] = C(n, k)
+        self.binomials = [[math.comb(n, k) for k in range(num_boxes + 1)] for n in range(num_spaces + 1)]
+
+    def rank(self, indices):
+        state = 1
+        for i, index in enumerate(indices):
+            state += self.binomials[index - 1][i + 1]
+        return state
+
+    def unrank(self, state):
+        indices = [0] * self.num_boxes
+        remainder = state - 1
+        candidate = self.num_spaces
+        for k in range(self.num_boxes, 0, -1):
+            candidate -= 1
+            while self.binomials[candidate][k] > remainder:
+                candidate -= 1
+            remainder -= self.binomials[candidate][k]
+            indices[k - 1] = candidate + 1
+        return indices
+
+    def indices2state(self, indices):
+        indices = sorted(indices)
+        for i in range(1, len(indices)):
+            # Two boxes on the same space
+            if indices[i] == indices[i - 1]:
+                return None
+
+        return self.rank(indices)
@@ -0,0 +1,129 @@
+import argparse
+import json
+import sys
+from dataclasses import dataclass, asdict
+import numpy as np
+from defines import *
+from board import Board, InvalidMap
+from level_pack import LevelPack
+from utilities import Utilities as utils
+
+
+@dataclass
+class Validation:
+    legal: bool
+    solved: bool
+    moves: int
+    pushes: int
+    goals_covered: int
+    num_goals: int
+    # Index of the first illegal move in the solution and why it is illegal
+    illegal_move: int = None
+    reason: str = None
+
+
+class SolutionValidator:
+    """
+    Replays solutions against a map without any display, in one step per move.
+
+    The board is flattened into cells row * cols + col with a ring of walls around it, so a
+    move is an addition of the cell offset of its letter. Upper case letters must push a box
+    and lower case letters must not, unless strict is False. Replaying stops at the first
+    illegal move; the pushes and goals covered are counted up to there.
+    """
+    def __init__(self, map_text, strict=True):
+        board = Board(map_text)
+        self.strict = strict
+        self.cols = board.cols + 2
+        self.walls = np.pad(board.walls, 1, constant_values=True).ravel().tolist()
+        self.goals = np.pad(board.goals, 1).ravel().tolist()
+        self.boxes = np.flatnonzero(np.pad(board.boxes, 1)).tolist()
+        self.num_goals = int(np.count_nonzero(board.goals))
+        self.agent = int(np.flatnonzero(np.pad(board.agent, 1))[0])
+        _, self.dir2offset = utils.create_direction_tables(self.cols)
+
+    def replay(self, solution):
+        boxes = bytearray(len(self.walls))
+        for cell in self.boxes:
+            boxes[cell] = 1
+        walls = self.walls
+        agent = self.agent
+        pushes = 0
+        illegal_move = reason = None
+
+        for i, letter in enumerate(solution):
+            offset = self.dir2offset.get(letter)
+            if offset is None:
+                illegal_move, reason = i, "unknown move " + repr(letter)
+                break
+            cell = agent + offset
+            if walls[cell]:
+                illegal_move, reason = i, "walks into a wall"
+                break
+            if boxes[cell]:
+                if self.strict and letter.islower():
+                    illegal_move, reason = i, "pushes a box with a lower case move"
+                    break
+                target = cell + offset
+                if walls[target] or boxes[target]:
+                    illegal_move, reason = i, "pushes a box into a wall or a box"
+                    break
+                boxes[cell] = 0
+                boxes[target] = 1
+                pushes += 1
+            elif self.strict and letter.isupper():
+                illegal_move, reason = i, "upper case move without a push"
+                break
+            agent = cell
+
+        goals_covered = sum(boxes[cell] for cell, goal in enumerate(self.goals) if goal)
+        moves = len(solution) if illegal_move is None else illegal_move
+        return Validation(illegal_move is None, illegal_move is None and goals_covered == self.num_goals,
+                          moves, pushes, goals_covered, self.num_goals, illegal_move, reason)
+
+    @staticmethod
+    def validate_batch(records, strict=True):
+        # Validates (map name, solution) pairs, reading and parsing every map only once
+        validators = {}
+        for name, solution in records:
+            if name not in validators:
+                try:
+                    validators[name] = SolutionValidator(LevelPack.read_level(name), strict)
+                except InvalidMap as error:
+                    validators[name] = error
+            validator = validators[name]
+            if isinstance(validator, InvalidMap):
+                # No move of a solution to a map that can not be played is legal
+                yield name, Validation(False, False, 0, 0, 0, 0, 0, str(validator))
+            else:
+                yield name, validator.replay(solution)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay solutions headless and check that they solve their maps.")
+    parser.add_argument("map", nargs="?", help="map file or path#n for level n of a pack")
+    parser.add_argument("solution", nargs="?", help="move string, upper case letters are pushes")
+    parser.add_argument("--batch", default=None,
+                        help="JSON lines with map and solution fields, as written by batch.py, - for standard input")
+    parser.add_argument("--lenient", action="store_true", help="accept pushes and walks in either case")
+    args = parser.parse_args()
+
+    if args.batch is not None:
+        lines = sys.stdin if args.batch == "-" else open(args.batch, 'r')
+        records = [json.loads(line) for line in lines if line.strip()]
+        # Maps without a solution (unsolved, timed out) are not checked
+        records = [(record["map"], record["solution"]) for record in records if record.get("solution") is not None]
+    elif args.map is not None and args.solution is not None:
+        records = [(args.map, args.solution)]
+    else:
+        parser.error("give a map and a solution, or --batch")
+
+    num_failed = 0
+    for name, validation in SolutionValidator.validate_batch(records, not args.lenient):
+        print(json.dumps({"map": name, **asdict(validation)}))
+        num_failed += not validation.solved
+    if num_failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()